@@ -0,0 +1,191 @@
+"""
+Synthetic repository generator, to benchmark actirepo at scale
+- generate: create a repository of categories, activities and quizzes with every supported question type
+
+Usage: python benchmarks/generate.py RUTA [--categories N] [--depth N] [--activities N] [--quizzes N] [--questions N] [--image-size WxH] [--seed N]
+"""
+
+import io
+import os
+import json
+import base64
+import random
+import argparse
+
+from xml.sax.saxutils import escape
+
+from PIL import Image
+
+# question types generated (the ones actirepo supports)
+TYPES = [ 'shortanswer', 'multichoice', 'truefalse', 'ddimageortext', 'ddmarker', 'essay' ]
+
+WORDS = ( 'red cable router switch puerto máscara subred enlace trama paquete servidor cliente '
+          'dirección protocolo capa físico lógico señal velocidad latencia ruta tabla' ).split()
+
+def _text(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+def _image(rng, size):
+    """
+    Create a png image with noise (so it does not compress much, like a screenshot or a photo)
+    - size: (width, height)
+    - returns: base64 encoded png
+    """
+    image = Image.effect_noise(size, 64).convert('RGB')
+    image = Image.blend(image, Image.new('RGB', size, tuple(rng.randrange(256) for _ in range(3))), 0.5)
+    png = io.BytesIO()
+    image.save(png, format='png')
+    return base64.b64encode(png.getvalue()).decode('ascii')
+
+def _file(name, data):
+    return f'<file name="{name}" path="/" encoding="base64">{data}</file>'
+
+def _answers(rng, count, correct, html = True):
+    answers = []
+    for i in range(count):
+        text = f'<p>{_text(rng, 4)}</p>' if html else _text(rng, 1)
+        answers.append(f'''
+    <answer fraction="{100 if i in correct else 0}" format="html">
+      <text><![CDATA[{text}]]></text>
+      <feedback format="html"><text></text></feedback>
+    </answer>''')
+    return ''.join(answers)
+
+def _question(rng, type, name, image_size, images):
+    """
+    Create the xml of a question
+    - type: question type
+    - name: question name
+    - image_size: size of the embedded images (width, height)
+    - images: pool of base64 images to embed (shared, so generating big repositories is fast)
+    - returns: xml string
+    """
+    statement = f'<p>{escape(_text(rng, 20))}</p>'
+    files = ''
+    # one in four statements has an embedded image
+    if rng.random() < 0.25:
+        statement += '<p><img src="@@PLUGINFILE@@/figure.png" alt="figure"></p>'
+        files = _file('figure.png', rng.choice(images))
+    body = ''
+    if type == 'shortanswer':
+        body = _answers(rng, 1, { 0 }, html=False)
+    elif type == 'multichoice':
+        body = _answers(rng, 4, set(rng.sample(range(4), rng.choice([ 1, 2 ]))))
+    elif type == 'truefalse':
+        correct = rng.choice([ 'true', 'false' ])
+        body = ''.join(f'''
+    <answer fraction="{100 if value == correct else 0}" format="moodle_auto_format">
+      <text>{value}</text>
+      <feedback format="html"><text></text></feedback>
+    </answer>''' for value in [ 'true', 'false' ])
+    elif type == 'essay':
+        body = f'''
+    <responseformat>{rng.choice([ 'editor', 'noinline' ])}</responseformat>
+    <responsefieldlines>{rng.choice([ 5, 10, 15 ])}</responsefieldlines>
+    <attachments>{rng.choice([ 0, 1, 3 ])}</attachments>
+    <maxbytes>{rng.choice([ 0, 1048576 ])}</maxbytes>
+    <filetypeslist>{rng.choice([ '', '.pdf,.docx' ])}</filetypeslist>'''
+    elif type == 'ddmarker':
+        body = _file('background.png', rng.choice(images)) + ''.join(f'''
+    <drag><no>{no}</no><text>{escape(_text(rng, 2))}</text><noofdrags>1</noofdrags></drag>''' for no in range(1, 4))
+    elif type == 'ddimageortext':
+        width, height = image_size
+        drags = []
+        drops = []
+        for no in range(1, 7):
+            # half of the drag items are images
+            image = _file(f'drag{no}.png', rng.choice(images)) if no % 2 == 0 else ''
+            drags.append(f'''
+    <drag><no>{no}</no><text>{escape(_text(rng, 2))}</text><draggroup>{1 + no % 2}</draggroup>{image}</drag>''')
+            drops.append(f'''
+    <drop><text></text><no>{no}</no><choice>{no}</choice><xleft>{rng.randrange(max(1, width - 100))}</xleft><ytop>{rng.randrange(max(1, height - 50))}</ytop></drop>''')
+        body = _file('background.png', rng.choice(images)) + ''.join(drags) + ''.join(drops)
+    return f'''
+  <question type="{type}">
+    <name><text>{escape(name)}</text></name>
+    <questiontext format="html">
+      <text><![CDATA[{statement}]]></text>
+      {files}
+    </questiontext>{body}
+  </question>
+'''
+
+def generate(path, categories = 2, depth = 2, activities = 3, quizzes = 2, questions = 2, image_size = (400, 300), seed = 0):
+    """
+    Create a synthetic repository
+    - path: repository directory (created if it does not exist)
+    - categories: subcategories in each category
+    - depth: levels of categories under the repository
+    - activities: activities in each category of the last level
+    - quizzes: quiz files in each activity
+    - questions: questions of each type in each quiz file
+    - image_size: size of the embedded images (width, height)
+    - seed: random seed (same arguments and seed, same repository)
+    - returns: dictionary with the number of categories, activities, quizzes and questions created
+    """
+    rng = random.Random(seed)
+    images = [ _image(rng, image_size) for _ in range(8) ]
+    counts = { 'categories': 0, 'activities': 0, 'quizzes': 0, 'questions': 0 }
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, 'repo.json'), 'w', encoding='utf-8') as outfile:
+        json.dump({ 'name': 'Synthetic repository', 'description': 'Repositorio generado para medir el rendimiento' }, outfile, indent=4)
+
+    def fill(directory, level):
+        if level < depth:
+            for i in range(categories):
+                category = os.path.join(directory, f'category{i + 1}')
+                os.makedirs(category, exist_ok=True)
+                with open(os.path.join(category, 'category.json'), 'w', encoding='utf-8') as outfile:
+                    json.dump({ 'name': f'Category {level + 1}.{i + 1}', 'description': _text(rng, 8), 'tags': [] }, outfile, indent=4)
+                counts['categories'] += 1
+                fill(category, level + 1)
+            return
+        for i in range(activities):
+            activity = os.path.join(directory, f'activity{i + 1}')
+            os.makedirs(activity, exist_ok=True)
+            with open(os.path.join(activity, 'activity.json'), 'w', encoding='utf-8') as outfile:
+                json.dump({ 'name': f'Activity {i + 1}', 'description': _text(rng, 10), 'difficulty': rng.choice([ 'easy', 'medium', 'hard' ]), 'tags': [] }, outfile, indent=4)
+            counts['activities'] += 1
+            for j in range(quizzes):
+                xml = [ '<?xml version="1.0" encoding="UTF-8"?>\n<quiz>' ]
+                for type in TYPES:
+                    for k in range(questions):
+                        xml.append(_question(rng, type, f'{type} {j + 1}.{k + 1}', image_size, images))
+                        counts['questions'] += 1
+                xml.append('</quiz>\n')
+                with open(os.path.join(activity, f'quiz{j + 1}.xml'), 'w', encoding='utf-8') as outfile:
+                    outfile.write(''.join(xml))
+                counts['quizzes'] += 1
+
+    fill(path, 0)
+    return counts
+
+def size(text):
+    """
+    Parse a size argument (WxH)
+    """
+    width, height = text.lower().split('x')
+    return (int(width), int(height))
+
+def add_arguments(parser):
+    """
+    Add the generator arguments to an argument parser
+    """
+    parser.add_argument('--categories', type=int, default=2, help='subcategories in each category (default 2)')
+    parser.add_argument('--depth', type=int, default=2, help='levels of categories (default 2)')
+    parser.add_argument('--activities', type=int, default=3, help='activities in each category of the last level (default 3)')
+    parser.add_argument('--quizzes', type=int, default=2, help='quiz files in each activity (default 2)')
+    parser.add_argument('--questions', type=int, default=2, help='questions of each type in each quiz (default 2)')
+    parser.add_argument('--image-size', type=size, default=(400, 300), metavar='WxH', help='size of the embedded images (default 400x300)')
+    parser.add_argument('--seed', type=int, default=0, help='random seed (default 0)')
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic actirepo repository')
+    parser.add_argument('path', help='repository directory')
+    add_arguments(parser)
+    args = parser.parse_args()
+    counts = generate(args.path, args.categories, args.depth, args.activities, args.quizzes, args.questions, args.image_size, args.seed)
+    print(', '.join(f'{count} {name}' for name, count in counts.items()))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+Benchmark of the actirepo stages on a synthetic repository
+- discovery: construction of the repository, its categories and activities (with their metadata)
+- parse: parsing of every quiz file into questions
+- stats: stats of the whole repository, streamed from the quiz files
+- html: html of every question, from its template
+- render: image of every question (without the rendered images cache)
+- readme: README of every artifact, with the images already up to date
+
+Usage: python benchmarks/run.py [--renderer placeholder] [--renderer chrome] [--keep RUTA] [generator options]
+"""
+
+import io
+import os
+import sys
+import time
+import shutil
+import tempfile
+import argparse
+
+from contextlib import redirect_stdout
+
+from tabulate import tabulate
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'src'))
+
+from generate import generate, add_arguments
+from actirepo.repo import Repo
+from actirepo.moodle.quiz import Quiz
+from actirepo.render.session import session, get_encoder, RENDERERS
+from actirepo.utils.image_utils import htmls2png
+from actirepo.utils.jobs import set_jobs
+
+def walk(category):
+    """
+    Get every category and activity under a category (loading their metadata)
+    - category: category
+    - returns: (categories, activities)
+    """
+    category.metadata
+    categories = [ category ]
+    activities = []
+    for activity in category.activities:
+        activity.metadata
+        activities.append(activity)
+    for subcategory in category.categories:
+        subcategories, subactivities = walk(subcategory)
+        categories += subcategories
+        activities += subactivities
+    return categories, activities
+
+def timed(function):
+    """
+    Run a function, hiding its output
+    - returns: (seconds, result)
+    """
+    start = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        result = function()
+    return time.perf_counter() - start, result
+
+def run(path, renderer, output, batch = 1):
+    """
+    Run every stage with a renderer
+    - path: path to repository
+    - renderer: rendering engine (one of RENDERERS)
+    - output: directory for the rendered images
+    - batch: questions rendered in each page load
+    - returns: list of rows (stage, items, unit, seconds)
+    """
+    rows = []
+
+    seconds, (categories, activities) = timed(lambda: walk(Repo(path)))
+    rows.append(('discovery', len(categories) + len(activities), 'artifacts', seconds))
+    quiz_files = [ os.path.join(activity.path, file) for activity in activities for file in activity.metadata['files'] ]
+    size = sum(os.path.getsize(file) for file in quiz_files) / 2**20
+
+    seconds, stats = timed(lambda: Repo(path).get_stats())
+    rows.append(('stats', len(quiz_files), 'quizzes', seconds))
+
+    with session(renderer=renderer, batch=batch):
+        # quizzes are created here (not taken from the run-wide registry) so every file is parsed
+        seconds, quizzes = timed(lambda: [ (quiz, quiz.questions) for quiz in map(Quiz, quiz_files) ])
+        questions = [ question for _, types in quizzes for questions in types.values() for question in questions ]
+        rows.append(('parse', len(questions), 'questions', seconds))
+        rows.append(('parse', size, 'MB', seconds))
+
+        seconds, htmls = timed(lambda: [ question.get_html() for question in questions ])
+        rows.append(('html', len(htmls), 'questions', seconds))
+
+        # images are encoded in the background, the stage ends when all of them are written
+        names = [ f'{i}.png' for i in range(len(htmls)) ]
+        seconds, _ = timed(lambda: ([ htmls2png(htmls[i:i + batch], output, names[i:i + batch]) for i in range(0, len(htmls), batch) ], get_encoder().wait()))
+        rows.append(('render', len(htmls), 'images', seconds))
+
+        # first build renders the images shown in the READMEs, the second one is timed
+        timed(lambda: Repo(path).create_readme(True, True))
+        seconds, _ = timed(lambda: Repo(path).create_readme(True, True))
+        rows.append(('readme', len(categories) + len(activities), 'READMEs', seconds))
+
+    if stats.total != len(questions):
+        raise Exception(f'Stats count {stats.total} questions, but {len(questions)} were parsed')
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark actirepo on a synthetic repository')
+    parser.add_argument('--renderer', action='append', choices=RENDERERS.keys(), help='rendering engine (can be repeated, default placeholder)')
+    parser.add_argument('--keep', metavar='PATH', help='generate the repository in PATH and keep it (by default a temporary directory is used)')
+    parser.add_argument('--batch', type=int, default=1, help='questions rendered in each page load (default 1)')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='parallel workers (default 1)')
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    set_jobs(args.jobs)
+    workdir = tempfile.mkdtemp(prefix='actirepo-bench-')
+    path = args.keep or os.path.join(workdir, 'repo')
+    try:
+        counts = generate(path, args.categories, args.depth, args.activities, args.quizzes, args.questions, args.image_size, args.seed)
+        print(f'Repository {path}:', ', '.join(f'{count} {name}' for name, count in counts.items()))
+        table = []
+        for renderer in args.renderer or [ 'placeholder' ]:
+            output = os.path.join(workdir, f'images-{renderer}')
+            try:
+                rows = run(path, renderer, output, args.batch)
+            except Exception as e:
+                print(f'Skipping renderer {renderer}: {e}')
+                continue
+            table += [ (renderer, stage, f'{items:g}', unit, f'{seconds:.3f}', f'{items / seconds:,.1f}' if seconds else '-') for stage, items, unit, seconds in rows ]
+        print(tabulate(table, headers=[ 'renderer', 'stage', 'items', 'unit', 'seconds', 'items/s' ]))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Startup check: `actirepo --version` and `actirepo --help` must stay cheap
+- checks that no heavy dependency is imported by those commands
+- measures the time they add to a bare interpreter start
+
+Usage: python benchmarks/startup.py [--runs N] [--max-ms MS]
+Exits with 1 if a heavy dependency is imported or the startup overhead is over the limit.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+# dependencies that only the commands that process artifacts need
+HEAVY_MODULES = [ 'PIL', 'jinja2', 'html2image', 'websocket', 'requests', 'tabulate', 'actirepo.moodle.quiz' ]
+
+# run the cli with the given arguments and print the heavy modules it imported
+PROBE = '''
+import sys, json
+from cli.__main__ import main
+sys.argv = [ 'actirepo' ] + sys.argv[1:]
+try:
+    main()
+except SystemExit:
+    pass
+print(json.dumps([ module for module in {modules} if module in sys.modules ]), file=sys.stderr)
+'''
+
+SRC_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'src')
+
+def run(code, *args):
+    """
+    Run python code in a new interpreter
+    - code: python code
+    - args: arguments for the code
+    - returns: (elapsed seconds, stderr)
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([ SRC_PATH, os.environ.get('PYTHONPATH', '') ]))
+    start = time.perf_counter()
+    result = subprocess.run([ sys.executable, '-c', code, *args ], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    return time.perf_counter() - start, result.stderr
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the startup time of the actirepo cli')
+    parser.add_argument('--runs', type=int, default=10, help='runs of each command (the median is used)')
+    parser.add_argument('--max-ms', type=float, default=150, help='max startup overhead over a bare interpreter, in milliseconds')
+    args = parser.parse_args()
+
+    baseline = statistics.median(run('pass')[0] for _ in range(args.runs))
+    print(f'{"bare interpreter":20} {baseline * 1000:8.1f} ms')
+
+    failed = False
+    probe = PROBE.format(modules=HEAVY_MODULES)
+    for command in [ '--version', '--help' ]:
+        times = []
+        for _ in range(args.runs):
+            elapsed, stderr = run(probe, command)
+            times.append(elapsed)
+        imported = json.loads(stderr.strip().splitlines()[-1])
+        overhead = (statistics.median(times) - baseline) * 1000
+        print(f'{"actirepo " + command:20} {overhead:+8.1f} ms', f'(imports {", ".join(imported)})' if imported else '')
+        if imported or overhead > args.max_ms:
+            failed = True
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
@@ -11,16 +11,17 @@ import os
 import json
 import shutil
 
-from jinja2 import Environment, FileSystemLoader
 from pprint import pprint
 from urllib.parse import quote
 
 from .__init__ import __icons_url__
 from .utils.file_utils import is_newer_than, anchorify, path_to_capitalized_list
 from .utils.console import title, input_string, input_list
+from .utils.profiler import span
 from .artifact import Artifact
 from .moodle.quiz import Quiz
 from .moodle.stats import Stats
+from .scanner import scan
 
 class Activity(Artifact):
     """
@@ -39,21 +40,43 @@ class Activity(Artifact):
     # supported difficulties
     DIFFICULTIES = [ 'easy', 'medium', 'hard' ]
 
-    def __init__(self, path):
+    def __init__(self, path, node = None):
         super().__init__("activity", path, self.METADATA_FILE)
-        self.quizzes = self.__get_quizzes()
+        # scanned directory, quizzes and stats are got on first access
+        self._node = node
+        self._quizzes = None
+        self._stats = None
 
-    def __get_quizzes(self):
+    @property
+    def node(self):
         """
-        Get quizzes in activity
-        - returns: list of quizzes in activity
+        Scanned activity directory
         """
-        return [ Quiz(os.path.join(self.path, file)) for file in self.metadata['files'] ]
+        if self._node is None:
+            self._node = scan(self.path, recursive=False)
+        return self._node
+
+    @property
+    def quizzes(self):
+        """
+        Quizzes in activity
+        """
+        if self._quizzes is None:
+            self._quizzes = [ Quiz.get(os.path.join(self.path, file)) for file in self.metadata['files'] ]
+        return self._quizzes
+
+    @property
+    def stats(self):
+        """
+        Stats of each quiz in activity: { file: Stats }
+        """
+        if self._stats is None:
+            self._stats = self.__get_stats(self.metadata['files'])
+        return self._stats
 
     def load(self):
         """
         Read activity descriptor
-        - full: if true, adds stats to activity descriptor
         - returns: activity descriptor
         """
         # checks if activity descriptor exists
@@ -76,12 +99,9 @@ class Activity(Artifact):
         # add category to activity descriptor if it is not present
         if not 'category' in self.metadata: self.metadata['category'] = path_to_capitalized_list(self.path)
         # if there are no files in activity descriptor, get all files in activity path
-        if not 'files' in self.metadata: self.metadata['files'] = [ file for file in os.listdir(self.path) if Quiz.is_quiz_file(os.path.join(self.path, file)) ]
+        if not 'files' in self.metadata: self.metadata['files'] = list(self.node.quiz_files)
         # if there is no limit in activity descriptor, set it to max int
         if not 'limit' in self.metadata: self.metadata['limit'] = Activity.LIMIT
-        # if full is true, add questions to activity descriptor
-        self.metadata['stats'] = self.__get_stats(self.metadata['files'])
-        self.metadata['full_stats'] = self.get_stats()
         return self.metadata
     
     def find_quizzes(self):
@@ -89,16 +109,16 @@ class Activity(Artifact):
         List quizzes in activity
         - returns: list of quizzes in moodle xml format
         """
-        return [ file for file in os.listdir(self.path) if Quiz.is_quiz_file(os.path.join(self.path, file)) ]
+        return list(scan(self.path, recursive=False).quiz_files)
     
     def __get_stats(self, files):
         """
-        Get activity stats
+        Get activity stats (from the quizzes shared by the whole run)
         - returns: activity stats
         """
         stats = {}
         for file in files:
-            quiz = Quiz(os.path.join(self.path, file))
+            quiz = Quiz.get(os.path.join(self.path, file))
             stats[file] = quiz.get_stats()
         return stats
     
@@ -107,7 +127,7 @@ class Activity(Artifact):
         Get activity total stats
         - returns: activity total stats
         """
-        all_stats = self.metadata['stats'].values()
+        all_stats = self.stats.values()
         result = Stats()
         for stats in all_stats:
             result += stats
@@ -123,40 +143,58 @@ class Activity(Artifact):
         activity_files = [ os.path.join(self.path, file) for file in activity_files ]
         return not is_newer_than(self.readme_file, activity_files)
     
-    def __generate_images(self):
-        # remove images folder if it exists
+    def __generate_images(self, force = False):
+        # remove images of quizzes that are no longer in the activity (the rest are updated incrementally)
         images_dir = os.path.join(self.path, 'images')
         if os.path.isdir(images_dir):
-            shutil.rmtree(images_dir)
+            quiz_names = { quiz.name for quiz in self.quizzes }
+            for entry in os.scandir(images_dir):
+                if entry.name in quiz_names:
+                    continue
+                print(f"Removing images {entry.path}...")
+                if entry.is_dir():
+                    shutil.rmtree(entry.path)
+                else:
+                    os.remove(entry.path)
         # generate images
         for quiz in self.quizzes:
-            quiz.generate_images(int(self.metadata['limit']))
+            quiz.generate_images(int(self.metadata['limit']), force)
 
     # create README.md file for activity (including some questions rendered as images)
     def create_readme(self, force = False):
         """
         Create README.md file for activity (including some questions rendered as images)
-        - force: if true, overwrite existing README.md    
+        - force: if true, overwrite existing README.md (and render every question again)
+        - returns: True if README.md was created, False if it was up to date
         """
         # avoid creating README.md if it is not necessary
         if not force and not self.is_upgradable():
             print(f'Skipping activity "{self.path}". README.md is newer than {Activity.METADATA_FILE} or some quizzes {self.quizzes}')
-            return
+            return False
         # print message
         title(f'Creating README.md for activity {self.name} in {self.path}...')
-        # generate images
-        self.__generate_images()
-        # load and render template
-        env = Environment(loader = FileSystemLoader(self.TEMPLATES_PATH, encoding='utf8'))
-        env.filters['anchorify'] = anchorify
-        env.filters['debug'] = pprint
-        env.filters['difficulty_to_badge'] = Activity.difficulty_to_badge
-        env.filters['quote'] = quote
-        template = env.get_template(self.README_TEMPLATE)
-        readme = template.render(activity = self, icons_url = __icons_url__, Quiz = Quiz)
-        # write to file
-        with open(self.readme_file, 'w', encoding='utf-8') as outfile:
-            outfile.write(readme)
+        with span('readme.activity', path=self.path):
+            # generate images
+            with span('readme.images', path=self.path):
+                self.__generate_images(force)
+            # load and render template
+            from .utils.template_utils import get_environment
+            env = get_environment(self.TEMPLATES_PATH, {
+                'anchorify': anchorify,
+                'debug': pprint,
+                'difficulty_to_badge': Activity.difficulty_to_badge,
+                'quote': quote
+            })
+            template = env.get_template(self.README_TEMPLATE)
+            with span('readme.jinja', path=self.path):
+                readme = template.render(activity = self, icons_url = __icons_url__, Quiz = Quiz)
+            # write to file
+            with open(self.readme_file, 'w', encoding='utf-8') as outfile:
+                outfile.write(readme)
+        # questions are only needed to build this README, so memory does not grow with the size of the repository
+        for quiz in self.quizzes:
+            quiz.release()
+        return True
 
     @staticmethod
     def has_quiz_files(path):
@@ -165,10 +203,7 @@ class Activity(Artifact):
         - path: path to activity directory
         - returns: True if directory has quiz files, False otherwise
         """
-        for file in os.listdir(path):
-            if Quiz.is_quiz_file(os.path.join(path, file)):
-                return True
-        return False
+        return len(scan(path, recursive=False).quiz_files) > 0
     
     @staticmethod
     def is_activity(path):
@@ -179,8 +214,7 @@ class Activity(Artifact):
         """
         if not os.path.isdir(path): 
             return False
-        descriptor = os.path.join(path, Activity.METADATA_FILE)
-        return os.path.isdir(path) and (os.path.isfile(descriptor) or Activity.has_quiz_files(path))
+        return scan(path, recursive=False).is_activity
 
     @staticmethod    
     def create(path):
@@ -203,8 +237,8 @@ class Activity(Artifact):
             'difficulty': input_string(f'Difficulty {Activity.DIFFICULTIES}', default_metadata['difficulty']),
             'tags': input_list('Tags', default_metadata['tags']),
             'author': {
-                'name': input_string('Author name', default_metadata['author']['name'] if default_metadata['author'] else os.environ.get('USER', os.environ.get('USERNAME'))),
-                'email': input_string('Author email', default_metadata['author']['email'] if default_metadata['author'] else '')
+                'name': input_string('Author name', default_metadata['author']['name'] if default_metadata.get('author') else os.environ.get('USER', os.environ.get('USERNAME'))),
+                'email': input_string('Author email', default_metadata['author']['email'] if default_metadata.get('author') else '')
             },
             'limit': input_string('Limit of questions of each type to display in the README', default_metadata['limit'])
         }
@@ -23,13 +23,27 @@ class Artifact(ABC):
         self.filename = filename
         self.readme_file = os.path.join(self.path, Artifact.README)
         self.descriptor = os.path.join(self.path, filename)
-        self.metadata = self.load()
+        # metadata is loaded on first access
+        self._metadata = None
 
     def __str__(self) -> str:
         return f'{self.name}'
     
     __repr__ = __str__
     
+    @property
+    def metadata(self) -> dict:
+        """
+        Artifact metadata (descriptor with default values), loaded on first access
+        """
+        if self._metadata is None:
+            self._metadata = self.load()
+        return self._metadata
+
+    @metadata.setter
+    def metadata(self, metadata):
+        self._metadata = metadata
+
     def exists(self) -> bool:
         return os.path.exists(self.path)
 
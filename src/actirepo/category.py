@@ -1,17 +1,19 @@
 import os
 import json
 
-from jinja2 import Environment, FileSystemLoader
 from pprint import pprint
 from urllib.parse import quote
 
 from .__init__ import __icons_url__, __project_name__, __project_version__, __project_url__
-from .utils.file_utils import anchorify, path_to_capitalized_list
+from .utils.file_utils import anchorify, path_to_capitalized_list, is_newer_than
 from .utils.console import title, input_string, input_list
+from .utils.profiler import span
+from .utils.jobs import parallel_map
 from .artifact import Artifact
 from .activity import Activity
 from .moodle.quiz import Quiz
 from .moodle.stats import Stats
+from .scanner import scan
 
 class Category(Artifact):
     """
@@ -24,23 +26,55 @@ class Category(Artifact):
     # metadata filename
     METADATA_FILE = 'category.json'
 
-    def __init__(self, path):
+    def __init__(self, path, node = None):
         super().__init__("category", path, self.METADATA_FILE)
+        # scanned tree, children and stats are got on first access
+        self._node = node
+        self._activities = None
+        self._categories = None
+        self._stats = None
+
+    @property
+    def node(self):
+        """
+        Scanned category tree
+        """
+        if self._node is None:
+            self._node = scan(self.path)
+        return self._node
+
+    @property
+    def activities(self):
+        """
+        Activities in category
+        """
+        if self._activities is None:
+            self._activities = self.__find_activities()
+        return self._activities
+
+    @property
+    def categories(self):
+        """
+        Subcategories in category
+        """
+        if self._categories is None:
+            self._categories = self.__find_categories()
+        return self._categories
 
     def __find_categories(self):
         """
         List subcategories in category
         - returns: list of subcategories in category
         """
-        return [ Category(os.path.join(self.path, file)) for file in os.listdir(self.path) if Category.is_category(os.path.join(self.path, file)) ]
+        return [ Category(child.path, child) for child in self.node.categories() ]
 
     def __find_activities(self):
         """
         List activities in category
         - returns: list of activities in category
         """
-        return [ Activity(os.path.join(self.path, file)) for file in os.listdir(self.path) if Activity.is_activity(os.path.join(self.path, file)) ]    
-   
+        return [ Activity(child.path, child) for child in self.node.activities() ]
+
     @staticmethod
     def is_category(path):
         """
@@ -50,18 +84,7 @@ class Category(Artifact):
         """
         if (not os.path.isdir(path)):
             return False
-        descriptor = os.path.join(path, Category.METADATA_FILE)
-        return (os.path.isfile(descriptor) or Category.__just_contains_folders(path))
-    
-    @staticmethod
-    def __just_contains_folders(path):
-        """
-        Check if a path just contains folders
-        """
-        for dirs in os.listdir(path):
-            if not os.path.isdir(dirs):
-                return False
-        return True
+        return scan(path, recursive=False).is_category
     
     def load(self):
         """
@@ -87,50 +110,86 @@ class Category(Artifact):
         if not 'category' in self.metadata: self.metadata['category'] = path_to_capitalized_list(self.path)
         # add tags to activity descriptor if it is not present
         if not 'tags' in self.metadata: self.metadata['tags'] = []
-        # find categories and activities
-        self.activities = self.__find_activities()
-        self.categories = self.__find_categories()
-        # add stats to activity descriptor if it is not present
-        self.metadata['stats'] = self.get_stats()
         return self.metadata
 
     def get_stats(self):
         """
-        Get category full stats
-        - returns: activity stats
+        Get category full stats (computed once)
+        - returns: category stats
+        """
+        if self._stats is None:
+            result = Stats()
+            for activity in self.activities:
+                result += activity.get_stats()
+            for category in self.categories:
+                result += category.get_stats()
+            self._stats = result
+        return self._stats
+
+    def get_dependencies(self):
+        """
+        Get files that README.md depends on: descriptors and quizzes of the whole tree, READMEs of the children
+        and category directories (that change when artifacts are added or removed). Only the scanned tree is used.
+        - returns: list of paths
+        """
+        dependencies = [ self.node.path, os.path.join(self.node.path, self.METADATA_FILE) ]
+        nodes = [ self.node ]
+        while nodes:
+            node = nodes.pop()
+            for child in node.activities():
+                dependencies.append(os.path.join(child.path, Activity.METADATA_FILE))
+                dependencies.append(os.path.join(child.path, Artifact.README))
+                dependencies.extend(os.path.join(child.path, file) for file in child.quiz_files)
+            for child in node.categories():
+                dependencies.append(child.path)
+                dependencies.append(os.path.join(child.path, Category.METADATA_FILE))
+                dependencies.append(os.path.join(child.path, Artifact.README))
+                nodes.append(child)
+        return dependencies
+
+    def is_upgradable(self):
+        """
+        Check if category is upgradable
+        - returns: True if README.md is older than its descriptor or anything in the category, False otherwise
         """
-        result = Stats()
-        for activity in self.activities:
-            result += activity.get_stats()
-        for category in self.categories:
-            result += category.get_stats()
-        return result
+        return not is_newer_than(self.readme_file, self.get_dependencies())
 
-    def create_readme(self, recursive = False):
+    def create_readme(self, recursive = False, force = False):
         """
         Create README.md file for category (including all activities in category and subcategories)
         - recursive: if true, create README.md files recursively
+        - force: if true, overwrite existing README.md files
+        - returns: True if README.md was created, False if it was up to date
         """
-        # print message
-        title(f'Creating README.md for {self.type} in {self.path}...')
         # if recursive, create README.md file for subcategories
+        changed = False
         if recursive:
-            for actitivy in self.activities:
-                actitivy.create_readme(True)
+            # activities are independent, so they can be built in parallel
+            changed = any(parallel_map(lambda activity: activity.create_readme(force), self.activities))
             for subcategory in self.categories:
-                subcategory.create_readme(recursive)
+                changed = subcategory.create_readme(recursive, force) or changed
+        # avoid creating README.md if nothing changed below
+        if not force and not changed and not self.is_upgradable():
+            print(f'Skipping {self.type} "{self.path}". README.md is newer than {self.METADATA_FILE} and everything in it')
+            return False
+        # print message
+        title(f'Creating README.md for {self.type} in {self.path}...')
         # load and render template
-        env = Environment(loader = FileSystemLoader(self.TEMPLATES_PATH, encoding='utf8'))
-        env.filters['anchorify'] = anchorify
-        env.filters['debug'] = pprint
-        env.filters['difficulty_to_string'] = Activity.difficulty_to_string
-        env.filters['difficulty_to_minibadge'] = Activity.difficulty_to_minibadge
-        env.filters['quote'] = quote
+        from .utils.template_utils import get_environment
+        env = get_environment(self.TEMPLATES_PATH, {
+            'anchorify': anchorify,
+            'debug': pprint,
+            'difficulty_to_string': Activity.difficulty_to_string,
+            'difficulty_to_minibadge': Activity.difficulty_to_minibadge,
+            'quote': quote
+        })
         template = env.get_template(self.README_TEMPLATE)
-        readme = template.render(category = self, Quiz = Quiz, icons_url = __icons_url__, project_name = __project_name__, project_version = __project_version__, project_url = __project_url__)
+        with span(f'readme.{self.type}', path=self.path):
+            readme = template.render(category = self, Quiz = Quiz, icons_url = __icons_url__, project_name = __project_name__, project_version = __project_version__, project_url = __project_url__)
         # write to file
         with open(self.readme_file, 'w', encoding='utf-8') as outfile:
             outfile.write(readme)
+        return True
 
     @staticmethod    
     def create(path):
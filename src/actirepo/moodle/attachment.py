@@ -0,0 +1,44 @@
+from actirepo.utils.mime_utils import get_mimetype
+
+class Attachment:
+    """
+    File embedded in a question (the encoded content is referenced, not copied)
+    """
+
+    __slots__ = ('name', 'path', 'encoding', 'data', '_url')
+
+    def __init__(self, element):
+        self.name = element.get('name')
+        self.path = element.get('path')
+        self.encoding = element.get('encoding')
+        self.data = element.text
+        self._url = None
+
+    @property
+    def mimetype(self):
+        return get_mimetype(self.name)
+
+    @property
+    def data_uri(self):
+        """
+        Data URI with the content of the file (built on each access, to be used only while rendering)
+        """
+        return f"data:{self.mimetype};{self.encoding},{self.data or ''}"
+
+    @property
+    def url(self):
+        """
+        Url of the file in the rendered html: a local asset of the rendering session (decoded once),
+        or its data URI if the session inlines embedded files
+        """
+        from actirepo.render.session import get_assets
+        assets = get_assets()
+        if assets is None:
+            return self.data_uri
+        # the url is remembered for the store that holds the asset (each session has its own)
+        if self._url is None or self._url[0] is not assets:
+            self._url = (assets, assets.url(self) or self.data_uri)
+        return self._url[1]
+
+    def __str__(self):
+        return f"{self.path}{self.name}"
@@ -1,28 +1,37 @@
-import json
-
 from .question import Question
-from actirepo.utils.mime_utils import get_mimetype
-from actirepo.utils.image_utils import get_image_size, htmlsize
+from actirepo.moodle.attachment import Attachment
 
 class DDImageOrText(Question):
     """
     Drag and drop question with images or text
     """
 
+    __slots__ = ('background', 'drags', 'drops', 'draggroups', 'draggroups_size')
+
+    # size of the image drag items that cannot be measured (empty files, SVGs without absolute size...)
+    DEFAULT_DRAG_SIZE = { "width": 100, "height": 100 }
+
+    # style of the text drag items
+    DRAG_STYLE = "padding: 5px;user-select:none;box-sizing:border-box;background-color:rgb(220, 220, 220);border-radius:0px 10px 0px 0px;vertical-align:top;margin:5px;height: auto;width: auto;cursor:move;border:1px solid rgb(0, 0, 0);display:inline-block;font:13px / 16.003px arial, helvetica, clean, sans-serif;"
+
     def __init__(self, element):
+        from actirepo.utils.image_utils import get_image_size
         super().__init__(element)
-        background_file = element.find('file')
-        self.background = f"data:{get_mimetype(background_file)};{background_file.get('encoding')},{background_file.text}"
-        self.drags = {
-            int(drag.find('no').text) : {
+        self.background = Attachment(element.find('file'))
+        # all text drag items are measured together
+        sizes = iter(DDImageOrText.measure_drags([ element ]))
+        self.drags = {}
+        for drag in element.findall('drag'):
+            file = drag.find('file')
+            image = Attachment(file) if file is not None else None
+            self.drags[int(drag.find('no').text)] = {
                 "no": int(drag.find('no').text),
                 "text": drag.find('text').text,
-                "type": "text" if drag.find('file') is None else "image",
-                "image": f"data:{get_mimetype(drag.find('file'))};{drag.find('file').get('encoding')},{drag.find('file').text}" if drag.find('file') is not None else None,
-                "size": self.__drop_text_size(drag.find('text').text) if not drag.find('file') else get_image_size(drag.find('file')),
+                "type": "text" if file is None else "image",
+                "image": image,
+                "size": next(sizes) if image is None else get_image_size(image) or dict(DDImageOrText.DEFAULT_DRAG_SIZE),
                 "draggroup": int(drag.find('draggroup').text)
-            } for drag in element.findall('drag')
-        }
+            }
         self.drops = {
             int(drop.find('choice').text) : {
                 "no": int(drop.find('no').text),
@@ -58,18 +67,13 @@ class DDImageOrText(Question):
                 "height": max_height
             }
     
-    # get size of text
-    def __drop_text_size(self, text):
+    @staticmethod
+    def measure_drags(elements):
         """
-        Get size of html text element
-        - text: text element
-        - return: { "width": int, "height": int }
+        Measure the text drag items of many questions in a single pass (sizes are remembered for the whole run)
+        - elements: ddimageortext question elements
+        - return: list of { "width": int, "height": int }, in document order
         """
-        html = f"""
-        <div style="box-sizing:border-box;">
-            <div style="padding: 5px;box-sizing:border-box;background-color:rgb(220, 220, 220);border-radius:0px 10px 0px 0px;display:none;vertical-align:top;margin:5px;height: auto;width: auto;cursor:move;border:1px solid rgb(0, 0, 0);font:13px / 16.003px arial, helvetica, clean, sans-serif;">{text}</div>
-            <div style="padding: 5px;user-select:none;box-sizing:border-box;background-color:rgb(220, 220, 220);border-radius:0px 10px 0px 0px;vertical-align:top;margin:5px;height: auto;width: auto;cursor:move;border:1px solid rgb(0, 0, 0);display:inline-block;font:13px / 16.003px arial, helvetica, clean, sans-serif;">{text}</div>
-        </div>
-        """
-        return htmlsize(html)
-
+        from actirepo.utils.image_utils import text_sizes
+        texts = [ drag.find('text').text for element in elements for drag in element.findall('drag') if drag.find('file') is None ]
+        return text_sizes(texts, DDImageOrText.DRAG_STYLE)
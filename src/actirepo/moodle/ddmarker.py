@@ -1,11 +1,13 @@
 from .question import Question
-from actirepo.utils.mime_utils import get_mimetype
+from actirepo.moodle.attachment import Attachment
 
 class DDMarker(Question):
     """
     Class to manage Drag and Drop Marker questions
     """
 
+    __slots__ = ('drags', 'background')
+
     def __init__(self, element):
         super().__init__(element)        
         self.drags = [
@@ -14,5 +16,4 @@ class DDMarker(Question):
                 "text": drag.find('text').text
             } for drag in element.findall('drag')
         ]
-        background_file = element.find('file')
-        self.background = f"data:{get_mimetype(background_file.get('name'))};{background_file.get('encoding')},{background_file.text}"
+        self.background = Attachment(element.find('file'))
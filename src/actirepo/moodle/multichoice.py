@@ -6,6 +6,8 @@ class MultiChoice(Question):
     Class to manage multichoice questions
     """
 
+    __slots__ = ('single',)
+
     def __init__(self, element):
         super().__init__(element)
         self.answers = [
@@ -1,81 +1,165 @@
 import os
+import base64
+import threading
 
-from bs4 import BeautifulSoup
-from jinja2 import Environment, FileSystemLoader
 from abc import ABC
 
-from actirepo import __icons_url__
+from actirepo.moodle.attachment import Attachment
 from actirepo.utils.mime_utils import get_mimetype
 from actirepo.utils.url_utils import encode
+from actirepo.utils.html_utils import rewrite_images
 from actirepo.utils.file_utils import get_available_filename, slugify
-from actirepo.utils.image_utils import html2png
+from actirepo.utils.profiler import span
+from actirepo.render.session import get_encoder, get_assets
 
 TEMPLATES_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'templates')
+ICONS_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'icons')
 
 class Question(ABC):
     """
     Question class
     """
 
+    __slots__ = ('type', 'name', 'attachments', 'answers', 'image_filename', 'image_key', '_statement')
+
+    # placeholder of the n-th attachment in the statement, replaced by its content when rendering
+    ATTACHMENT_SRC = '@@ATTACHMENT:{}@@'
+
+    # urls of the icons already used, by name (with the asset store they belong to)
+    __icons = {}
+    __icons_lock = threading.Lock()
+
     def __init__(self, element):
-        self.element = element
-        self.type = self.element.get('type')
-        self.name = self.element.find('name').find('text').text
-        self.statement = self.__process_text(self.element.find('questiontext'))
+        # the element is not kept, so the xml tree can be released once questions are built
+        self.type = element.get('type')
+        self.name = element.find('name').find('text').text
+        self.attachments, self._statement = self.__process_text(element.find('questiontext'))
         self.answers = [ answer.text for answer in element.findall('answer') ]
         self.image_filename = None
+        self.image_key = None
+
+    @property
+    def statement(self):
+        """
+        Statement html with the urls of its attachments (built on each access, to be used only while rendering)
+        """
+        statement = self._statement
+        for i, attachment in enumerate(self.attachments):
+            statement = statement.replace(Question.ATTACHMENT_SRC.format(i), attachment.url)
+        return statement
 
     def __process_text(self, element):
         """
         Process text in question element
         - element: question element
-        - return: html with embedded attachments
+        - return: (attachments referenced by the text, html with a placeholder in place of each attachment)
         """
-        attachments = [ 
-            {
-                "name": file.get('name'),
-                "path": file.get('path'),
-                "type": get_mimetype(file.get('name')),
-                "image": f"data:{get_mimetype(file.get('name'))};{file.get('encoding')},{file.text}"
-            } for file in element.findall('file')    
-        ]
-        html = BeautifulSoup(element.find('text').text, 'html.parser')
-        for attachment in attachments:
-            for img in html.find_all('img'):
-                if f"@@PLUGINFILE@@{attachment.get('path')}{encode(attachment.get('name'))}" in img.get('src'):
-                    img['class'] = img.get('class', []) + ['img-fluid']
-                    img['src'] = attachment.get('image')
-        return html.prettify()
-
-    def render(self, destination_dir, prefix = '', save_html = False):
+        html = element.findtext('text') or ''
+        # attachments by the url that references them in the text (the first one wins, as files are listed in order)
+        files = {}
+        for file in element.findall('file'):
+            attachment = Attachment(file)
+            files.setdefault(f"@@PLUGINFILE@@{attachment.path}{encode(attachment.name)}", attachment)
+        attachments = []
+        if not files or '@@PLUGINFILE@@' not in html:
+            return attachments, html
+
+        def replace(src):
+            attachment = files.get(src)
+            if attachment is None:
+                return None
+            attachments.append(attachment)
+            return Question.ATTACHMENT_SRC.format(len(attachments) - 1)
+
+        with span('question.text', question=self.name):
+            return attachments, rewrite_images(html, replace, 'img-fluid')
+
+    def get_html(self):
+        """
+        Get question html, rendered from the template of its type
+        - return: html string
+        """
+        from actirepo.utils.template_utils import get_environment
+        template = get_environment(TEMPLATES_PATH).get_template(f'{self.type}.template.html')
+        with span('question.jinja', question=self.name):
+            return template.render(question = self, icon = Question.icon)
+
+    @staticmethod
+    def icon(name):
+        """
+        Get the url of an icon bundled with the package, for the rendered html (no network is needed to render it)
+        - name: icon file name (in ICONS_PATH)
+        - return: url of a local asset of the rendering session, or data URI if the session inlines embedded files
+        """
+        assets = get_assets()
+        with Question.__icons_lock:
+            cached = Question.__icons.get(name)
+        if cached and cached[0] is assets:
+            return cached[1]
+        with open(os.path.join(ICONS_PATH, name), 'rb') as infile:
+            data = infile.read()
+        url = assets.add(name, data) if assets else f"data:{get_mimetype(name)};base64,{base64.b64encode(data).decode('ascii')}"
+        with Question.__icons_lock:
+            Question.__icons[name] = (assets, url)
+        return url
+
+    def render(self, destination_dir, prefix = '', save_html = False, image_filename = None, previous_key = None, writes = None):
         """
         Render question as image
         - question: question xml element
         - destination_dir: directory to save question image
         - save_html: also save html to file
+        - image_filename: image filename (if not specified, the first available one is used)
+        - previous_key: key of the existing image (it is kept if the question has not changed)
+        - writes: list that gets the background writes of the image (if None, the image is written before returning)
         - return: image filename
         """
 
-        # create question data
-        print(f"generando imagen {self.type} para la pregunta ", self.name)
-            
+        # rendering dependencies are only imported when questions are rendered
+        from actirepo.utils.image_utils import html2png
+
         # render html from template
-        env = Environment(loader = FileSystemLoader(TEMPLATES_PATH, encoding='utf8'))
-        template = env.get_template(f'{self.type}.template.html')
-        html = template.render(question = self, icons_url = __icons_url__)
+        html = self.prepare_render(destination_dir, prefix, image_filename, previous_key)
 
         # html to image
-        self.image_filename = prefix + slugify(self.name) + ".png"
-        self.image_filename = get_available_filename(destination_dir, self.image_filename)
-        html2png(html, destination_dir, self.image_filename)
+        if html is not None:
+            with span('question.render', question=self.name, type=self.type):
+                futures = html2png(html, destination_dir, self.image_filename)
+            if writes is None:
+                get_encoder().wait(futures)
+            else:
+                writes.extend(futures)
 
         # writes html to file
         if save_html:
-            html_filename = self.image_filename.replace('.png', '.html')
+            html_filename = os.path.splitext(self.image_filename)[0] + '.html'
             with open(os.path.join(destination_dir, html_filename), 'w') as outfile:
-                outfile.write(html)
+                outfile.write(html if html is not None else self.get_html())
         
         return self.image_filename
+
+    def prepare_render(self, destination_dir, prefix = '', image_filename = None, previous_key = None):
+        """
+        Get the html to render the question, unless its image is up to date (the image key and filename are set)
+        - destination_dir: directory to save question image
+        - image_filename: image filename (if not specified, the first available one is used)
+        - previous_key: key of the existing image (it is kept if the question has not changed)
+        - return: html string, or None if the existing image is kept
+        """
+        from actirepo.utils.image_utils import html_key
+
+        html = self.get_html()
+        self.image_key = html_key(html)
+        if image_filename:
+            self.image_filename = image_filename
+        else:
+            self.image_filename = prefix + slugify(self.name) + get_encoder().extension
+            self.image_filename = get_available_filename(destination_dir, self.image_filename)
+        if previous_key == self.image_key and os.path.isfile(os.path.join(destination_dir, self.image_filename)):
+            print(f"imagen {self.type} sin cambios para la pregunta ", self.name)
+            return None
+        print(f"generando imagen {self.type} para la pregunta ", self.name)
+        return html
         
     def __str__(self):
         return f"{self.type}: {self.name}"
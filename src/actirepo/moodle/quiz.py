@@ -1,5 +1,6 @@
 import os
-import shutil
+import json
+import threading
 import xml.etree.ElementTree as ET
 
 from pathlib import Path
@@ -11,6 +12,11 @@ from actirepo.moodle.ddimageortext import DDImageOrText
 from actirepo.moodle.ddmarker import DDMarker
 from actirepo.moodle.essay import Essay
 from actirepo.moodle.stats import Stats
+from actirepo.moodle.stats_cache import get_cache as get_stats_cache
+from actirepo.render.session import get_encoder, get_batch, get_refresh
+from actirepo.utils.file_utils import get_available_filename, slugify
+from actirepo.utils.jobs import parallel_map
+from actirepo.utils.profiler import span
 
 class Quiz():
     """
@@ -57,6 +63,17 @@ class Quiz():
         #}
     }
 
+    # keys of the generated images, used to render only new or changed questions
+    MANIFEST_FILE = '.manifest.json'
+
+    # quizzes parsed in this run, by absolute path: { path: (mtime, quiz) }
+    __registry = {}
+
+    # quiz file checks done in this run, by absolute path: { path: (mtime, is quiz file) }
+    __quiz_files = {}
+
+    __lock = threading.Lock()
+
     def __init__(self, quizfile):
         if not Quiz.is_quiz_file(quizfile):
             raise Exception(f'Error: {quizfile} is not a quiz file')
@@ -64,26 +81,84 @@ class Quiz():
         self.quizfile = quizfile
         self.filename = os.path.basename(quizfile)
         self.path = os.path.dirname(quizfile)
-        self.root = ET.parse(quizfile).getroot()
-        self.questions = self.__read_questions()
+        # file is parsed on first access to questions
+        self._questions = None
+        self._stats = None
+
+    @property
+    def questions(self):
+        """
+        Questions organized by type (the file is parsed on first access)
+        """
+        if self._questions is None:
+            with span('quiz.parse', file=self.quizfile):
+                self._questions = self.__read_questions()
+        return self._questions
+
+    @staticmethod
+    def get(quizfile):
+        """
+        Get the quiz of a file, shared by every consumer in this run (the file is parsed again only if it changes)
+        - quizfile: path to quiz file
+        - returns: Quiz
+        """
+        path = os.path.abspath(quizfile)
+        mtime = os.stat(path).st_mtime_ns
+        with Quiz.__lock:
+            entry = Quiz.__registry.get(path)
+        if entry and entry[0] == mtime:
+            return entry[1]
+        quiz = Quiz(quizfile)
+        with Quiz.__lock:
+            Quiz.__registry[path] = (mtime, quiz)
+        return quiz
+
+    def release(self):
+        """
+        Release the questions of the quiz (with their embedded files) once they are no longer needed.
+        Its stats are kept, and the file is parsed again if questions are requested later.
+        """
+        if self._questions is not None:
+            self.get_stats()
+            self._questions = None
 
     def __read_questions(self):
         """
-        Get questions from file
-        - activity_path: path to activity
-        - file: questions file
-        - returns: list of questions organized by file and type
+        Get questions from file, streaming it (each question element is released once its question is built)
+        - returns: list of questions organized by type
         """
         # search "question" tags under "quiz" tag
+        entries = []
+        depth = 0
+        with open(self.quizfile, 'rb') as infile:
+            for event, element in ET.iterparse(infile, events=('start', 'end')):
+                if event == 'start':
+                    depth += 1
+                    continue
+                depth -= 1
+                if depth != 1 or element.tag != 'question':
+                    continue
+                # get question type
+                type = element.get('type')
+                # skip if question type is not supported
+                if not type in self.SUPPORTED_QUESTIONS.keys():
+                    element.clear()
+                # drag and drop questions are built at the end, to measure all their text drag items in one pass
+                elif type == 'ddimageortext':
+                    entries.append((type, element))
+                else:
+                    with span('question.build', question=element.findtext('name/text')):
+                        entries.append((type, self.SUPPORTED_QUESTIONS[type]['class'](element)))
+                    element.clear()
+        with span('question.measure', file=self.quizfile):
+            DDImageOrText.measure_drags([ element for type, element in entries if type == 'ddimageortext' ])
         questions = {}
-        for element in self.root.findall('question'):
-            # get question type
-            type = element.get('type')
-            # skip if question type is not supported
-            if not type in self.SUPPORTED_QUESTIONS.keys():
-                continue
-            # create question
-            question = self.SUPPORTED_QUESTIONS[type]['class'](element)
+        for type, question in entries:
+            if type == 'ddimageortext':
+                element = question
+                with span('question.build', question=element.findtext('name/text')):
+                    question = DDImageOrText(element)
+                element.clear()
             # check if question type is in types dictionary, and add it if not
             if not type in questions:
                 questions[type] = [ question ]
@@ -99,62 +174,183 @@ class Quiz():
         return { type for type in self.questions }
 
     def get_stats(self):
+        """
+        Get quiz stats (if questions are not loaded, they are taken from the stats cache or counted without building them)
+        - returns: quiz stats
+        """
+        if self._stats is None:
+            if self._questions is None:
+                self._stats = self.__read_stats()
+            else:
+                self._stats = Stats()
+                self._stats.types = { type: len(question) for type, question in self._questions.items() }
+                self._stats.total = sum([len(question) for question in self._questions.values()])
+        return self._stats
+
+    def __read_stats(self):
+        """
+        Get stats of the questions from the stats cache of the run, or from the file if there is no cache
+        - returns: quiz stats
+        """
+        cache = get_stats_cache()
+        with span('quiz.stats', file=self.quizfile):
+            if cache is None:
+                return Quiz.read_stats(self.quizfile)
+            return cache.get(self.quizfile, Quiz.read_stats)
+
+    @staticmethod
+    def read_stats(quiz_file):
+        """
+        Count supported questions of each type, streaming the file (questions are not built and elements are released as they are read)
+        - quiz_file: path to quiz file
+        - returns: quiz stats
+        """
         stats = Stats()
-        stats.types = { type: len(question) for type, question in self.questions.items() } 
-        stats.total = sum([len(question) for question in self.questions.values()]) 
+        depth = 0
+        with open(quiz_file, 'rb') as infile:
+            for event, element in ET.iterparse(infile, events=('start', 'end')):
+                if event == 'start':
+                    depth += 1
+                    continue
+                depth -= 1
+                # questions are the children of the root "quiz" tag
+                if depth != 1:
+                    continue
+                type = element.get('type')
+                if element.tag == 'question' and type in Quiz.SUPPORTED_QUESTIONS:
+                    stats.types[type] = stats.types.get(type, 0) + 1
+                    stats.total += 1
+                element.clear()
         return stats
 
-    def generate_images(self, limit=9999):
+    def plan_images(self, limit=9999):
+        """
+        Choose the questions to render and their image filenames
+        - limit: max number of questions of each type
+        - returns: list of (type, question, image filename), in the same order as a serial render
+        """
+        extension = get_encoder().extension
+        reserved = set()
+        plan = []
+        for type, questions in self.questions.items():
+            for question in questions[:limit]:
+                image_file = get_available_filename(None, slugify(question.name) + extension, reserved)
+                plan.append((type, question, image_file))
+        return plan
+
+    def generate_images(self, limit=9999, force=False):
         """
-        Generate images for questions in activity
-        - activity: activity descriptor
-        - force: if true, overwrite existing images
+        Generate images for questions in activity, reconciling them with the existing ones
+        (only new or changed questions are rendered, and images of questions no longer shown are removed)
+        - limit: max number of questions of each type
+        - force: if true, render every question again (as always when the rendering session refreshes images)
+        - returns: images organized by type
         """
         images_dir = os.path.join(self.path, f"images/{self.name}")
-        # if images directory exists and force is true, delete it
-        if os.path.isdir(images_dir):
-            print("Overwriting existing images...")
-            shutil.rmtree(images_dir)
+        os.makedirs(images_dir, exist_ok=True)
+        # filenames are chosen before rendering, so parallel renders get the same names as a serial run
+        plan = self.plan_images(limit)
+        # existing images are kept only while their manifest entry matches (without entries, every question is rendered)
+        manifest = {} if force or get_refresh() else self.__read_manifest(images_dir)
+        # remove images of questions that no longer exist or exceed the limit
+        planned = { image_file for _, _, image_file in plan }
+        for file in os.listdir(images_dir):
+            if file not in planned and file != Quiz.MANIFEST_FILE:
+                print(f"Removing image {file}...")
+                os.remove(os.path.join(images_dir, file))
+        # render new or changed questions
+        batch = get_batch()
+        writes = []
+        if batch == 1:
+            parallel_map(lambda item: item[1].render(images_dir, image_filename=item[2], previous_key=manifest.get(item[2]), writes=writes), plan)
+        else:
+            # questions to render are laid out together, batch by batch, and each one is captured in its own image
+            from actirepo.utils.image_utils import htmls2png
+            pending = [ (html, image_file) for _, question, image_file in plan
+                        if (html := question.prepare_render(images_dir, image_filename=image_file, previous_key=manifest.get(image_file))) is not None ]
+            batches = [ pending[i:i + batch] for i in range(0, len(pending), batch) ]
+            for futures in parallel_map(lambda items: htmls2png([ html for html, _ in items ], images_dir, [ image_file for _, image_file in items ]), batches):
+                writes.extend(futures)
+        # images are encoded in the background while the next ones are rendered
+        # (the encoder is shared with other quizzes built in parallel, only the images of this one are waited for)
+        get_encoder().wait(writes)
+        self.__write_manifest(images_dir, { image_file: question.image_key for _, question, image_file in plan })
         # create images dictionary
         images = {}
-        # walk through all questions in file
-        for type, questions in self.questions.items():
-            count = 0
-            # walk through all questions of the same type
-            for question in questions:
-                # render image for question
-                image_file = question.render(images_dir)
-                # if image was generated, add it to dictionary
-                if image_file:
-                    count += 1
-                    image_file = f"{self.name}/{image_file}"
-                    question.image_filename = image_file
-                    # check if question type is in images dictionary, and add it if not
-                    if not type in images:
-                        images[type] = [ image_file ]
-                    else:
-                        images[type].append(image_file)
-                if count >= limit:
-                    break
+        for type, question, image_file in plan:
+            image_file = f"{self.name}/{image_file}"
+            question.image_filename = image_file
+            # check if question type is in images dictionary, and add it if not
+            if not type in images:
+                images[type] = [ image_file ]
+            else:
+                images[type].append(image_file)
         return images
 
+    @staticmethod
+    def __read_manifest(images_dir):
+        """
+        Read the keys of the images previously generated
+        - images_dir: images directory
+        - returns: dictionary { image filename: key }
+        """
+        try:
+            with open(os.path.join(images_dir, Quiz.MANIFEST_FILE), 'r', encoding='utf-8') as json_file:
+                return json.load(json_file)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    @staticmethod
+    def __write_manifest(images_dir, manifest):
+        """
+        Write the keys of the generated images (only if they changed)
+        - images_dir: images directory
+        - manifest: dictionary { image filename: key }
+        """
+        if manifest == Quiz.__read_manifest(images_dir):
+            return
+        with open(os.path.join(images_dir, Quiz.MANIFEST_FILE), 'w', encoding='utf-8') as outfile:
+            json.dump(manifest, outfile, indent=4, sort_keys=True)
+
     @staticmethod
     def is_quiz_file(quiz_file):
         """
-        Check if a file is a quiz file
+        Check if a file is a quiz file (the result is remembered while the file does not change)
         - questions_file: path to questions file
         - returns: True if file is a quiz file, False otherwise
         """
         # check if file is an xml file
         if not quiz_file.endswith('.xml'):
             return False
-        # get full path to questions file and parse xml
+        path = os.path.abspath(quiz_file)
         try:
-            tree = ET.parse(quiz_file)
-            # check if root is "quiz" tag 
-            return tree.getroot().tag == 'quiz'
-        except:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
             return False
+        with Quiz.__lock:
+            entry = Quiz.__quiz_files.get(path)
+        if entry and entry[0] == mtime:
+            return entry[1]
+        # check if root is "quiz" tag (reading only up to the first start element)
+        result = Quiz.root_tag(quiz_file) == 'quiz'
+        with Quiz.__lock:
+            Quiz.__quiz_files[path] = (mtime, result)
+        return result
+
+    @staticmethod
+    def root_tag(xml_file):
+        """
+        Get the root tag of an xml file, without parsing the whole document
+        - xml_file: path to xml file
+        - returns: root tag, or None if the file is not xml
+        """
+        try:
+            with open(xml_file, 'rb') as infile:
+                for _, element in ET.iterparse(infile, events=('start',)):
+                    return element.tag
+        except (ET.ParseError, OSError):
+            return None
+        return None
 
     def __str__(self):
         return f'{self.quizfile}'
@@ -5,6 +5,8 @@ class ShortAnswer(Question):
     Class to manage short answer questions
     """
 
+    __slots__ = ('first_answer',)
+
     def __init__(self, element):
         super().__init__(element)
         self.answers = [
@@ -21,5 +21,23 @@ class Stats:
                 result.types[key] = value
         return result
     
+    def to_dict(self):
+        """
+        Get stats as a dictionary (to store them as json)
+        """
+        return { "total": self.total, "types": dict(self.types) }
+
+    @staticmethod
+    def from_dict(data):
+        """
+        Get stats from a dictionary
+        - data: dictionary { "total": int, "types": { type: int } }
+        - returns: stats
+        """
+        stats = Stats()
+        stats.total = data['total']
+        stats.types = dict(data['types'])
+        return stats
+
     def __str__(self):
         return self.__dict__.__str__()
@@ -0,0 +1,176 @@
+"""
+Persistent cache of quiz stats, so unchanged quiz files are not read again in later runs
+- StatsCache: stats of each quiz file, keyed by its fingerprint
+- open_cache: open the stats cache of the run
+- get_cache: get the stats cache of the run (None if there is none)
+- close_cache: save and close the stats cache of the run
+- stats_cache: context manager that opens and closes the stats cache of the run
+"""
+
+import os
+import json
+import hashlib
+import threading
+
+from contextlib import contextmanager
+
+from actirepo.moodle.stats import Stats
+
+class StatsCache:
+    """
+    Stats cache stored in the repository (.actirepo/cache.json).
+    An entry is valid while its file keeps the same size and mtime, or the same content hash if they changed.
+    """
+
+    # cache directory, created in the repository
+    DIRECTORY = '.actirepo'
+
+    # cache file, inside the cache directory
+    FILE = 'cache.json'
+
+    # bump when the format of the entries changes, to discard old caches
+    VERSION = 2
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.directory = os.path.join(self.root, StatsCache.DIRECTORY)
+        self.file = os.path.join(self.directory, StatsCache.FILE)
+        self.entries = self.__read()
+        self.changed = False
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def find_root(path):
+        """
+        Find the directory of the cache for a path: the closest one (the path or a parent) with a cache directory, or the path itself
+        - path: path to an artifact
+        - returns: path to directory
+        """
+        path = os.path.abspath(path)
+        directory = path
+        while True:
+            if os.path.isdir(os.path.join(directory, StatsCache.DIRECTORY)):
+                return directory
+            parent = os.path.dirname(directory)
+            if parent == directory:
+                return path
+            directory = parent
+
+    def __read(self):
+        """
+        Read cache file
+        - returns: entries { relative path: entry }
+        """
+        try:
+            with open(self.file, 'r', encoding='utf-8') as json_file:
+                data = json.load(json_file)
+        except (FileNotFoundError, ValueError):
+            return {}
+        if not isinstance(data, dict) or data.get('version') != StatsCache.VERSION:
+            return {}
+        return data.get('entries', {})
+
+    @staticmethod
+    def __hash(file):
+        """
+        Get content hash of a file
+        - file: path to file
+        - returns: hex digest
+        """
+        digest = hashlib.sha256()
+        with open(file, 'rb') as infile:
+            for chunk in iter(lambda: infile.read(2**20), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def get(self, quiz_file, read):
+        """
+        Get stats of a quiz file, reading it only if it changed since it was cached
+        - quiz_file: path to quiz file
+        - read: function that reads the file, returning its stats
+        - returns: quiz stats
+        """
+        path = os.path.abspath(quiz_file)
+        key = os.path.relpath(path, self.root)
+        stat = os.stat(path)
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime_ns:
+            return Stats.from_dict(entry['stats'])
+        # same content with a new mtime (e.g. after a checkout) is still valid
+        digest = StatsCache.__hash(path)
+        if entry and entry['hash'] == digest:
+            stats = Stats.from_dict(entry['stats'])
+        else:
+            stats = read(quiz_file)
+        with self.lock:
+            self.entries[key] = {
+                'size': stat.st_size,
+                'mtime': stat.st_mtime_ns,
+                'hash': digest,
+                'stats': stats.to_dict()
+            }
+            self.changed = True
+        return stats
+
+    def save(self):
+        """
+        Write the cache file (only if it changed), evicting the entries of files that no longer exist
+        """
+        with self.lock:
+            stale = [ key for key in self.entries if not os.path.isfile(os.path.join(self.root, key)) ]
+            for key in stale:
+                del self.entries[key]
+            if not self.changed and not stale:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            # the cache is local to each copy of the repository
+            gitignore = os.path.join(self.directory, '.gitignore')
+            if not os.path.isfile(gitignore):
+                with open(gitignore, 'w', encoding='utf-8') as outfile:
+                    outfile.write('*\n')
+            tmp_file = f'{self.file}.tmp'
+            with open(tmp_file, 'w', encoding='utf-8') as outfile:
+                json.dump({ 'version': StatsCache.VERSION, 'entries': self.entries }, outfile, ensure_ascii=False)
+            os.replace(tmp_file, self.file)
+            self.changed = False
+
+_cache = None
+
+def open_cache(path):
+    """
+    Open the stats cache of the run
+    - path: path to the artifact processed in the run (the cache is searched in it and its parents)
+    - returns: stats cache
+    """
+    global _cache
+    _cache = StatsCache(StatsCache.find_root(path))
+    return _cache
+
+def get_cache():
+    """
+    Get the stats cache of the run
+    - returns: StatsCache or None
+    """
+    return _cache
+
+def close_cache():
+    """
+    Save and close the stats cache of the run
+    """
+    global _cache
+    if _cache is not None:
+        _cache.save()
+        _cache = None
+
+@contextmanager
+def stats_cache(path):
+    """
+    Open the stats cache of the run and save it on exit
+    - path: path to the artifact processed in the run
+    """
+    open_cache(path)
+    try:
+        yield get_cache()
+    finally:
+        close_cache()
@@ -5,6 +5,8 @@ class TrueFalse(Question):
     Class to manage true/false questions
     """
 
+    __slots__ = ()
+
     def __init__(self, element):
         super().__init__(element)
         self.answers = [
@@ -12,5 +14,5 @@ class TrueFalse(Question):
                 "text": answer.find('text').text,
                 "feedback": answer.find('feedback').find('text').text,
                 "fraction": float(answer.get('fraction'))
-            } for answer in self.element.findall('answer')
+            } for answer in element.findall('answer')
         ]
\ No newline at end of file
@@ -0,0 +1,64 @@
+"""
+Files embedded in questions, served to the renderer as local files instead of data URIs
+- ASSET_MODES: ways of passing embedded files to the renderer
+- AssetStore: directory of embedded files, decoded once and named by the hash of their content
+"""
+
+import os
+import base64
+import hashlib
+import tempfile
+
+# ways of passing embedded files to the renderer
+ASSET_MODES = {
+    'files': 'cada fichero incrustado se escribe una vez en el directorio del navegador y se enlaza',
+    'inline': 'los ficheros incrustados se incluyen en el HTML como data URI'
+}
+
+# default asset mode
+DEFAULT_ASSET_MODE = 'files'
+
+class AssetStore:
+    """
+    Embedded files decoded into a directory next to the pages of the renderer, and referenced by a relative url
+    (the url only depends on the content, so the html, and the key of its image, are the same in every run)
+    """
+
+    # url of the assets, relative to the pages of the renderer
+    URL = 'assets'
+
+    def __init__(self, directory = None):
+        """
+        - directory: directory of the assets (None if the renderer does not load them, then only urls are built)
+        """
+        self.directory = directory
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def url(self, attachment):
+        """
+        Get the url of an embedded file, writing it to the directory if it is not there yet
+        - attachment: embedded file
+        - returns: relative url, or None if the file is not base64 encoded
+        """
+        if attachment.encoding != 'base64' or attachment.data is None:
+            return None
+        return self.add(attachment.name, base64.b64decode(attachment.data))
+
+    def add(self, filename, data):
+        """
+        Get the url of some content, writing it to the directory if it is not there yet
+        - filename: original file name (only its extension is kept)
+        - data: content
+        - returns: relative url
+        """
+        name = hashlib.sha256(data).hexdigest() + os.path.splitext(filename or '')[1].lower()
+        if self.directory:
+            path = os.path.join(self.directory, name)
+            if not os.path.isfile(path):
+                # written to a temporary file first, another thread may be writing the same asset
+                fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+                with os.fdopen(fd, 'wb') as outfile:
+                    outfile.write(data)
+                os.replace(tmp_path, path)
+        return f'{AssetStore.URL}/{name}'
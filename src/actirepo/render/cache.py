@@ -0,0 +1,122 @@
+"""
+Content-addressed cache of rendered images
+- RenderCache: directory of images named by the hash of the html (and renderer settings) that produced them
+"""
+
+import hashlib
+import os
+import shutil
+import threading
+
+from actirepo.utils.file_utils import user_cache_dir, link_or_copy
+
+class RenderCache:
+    """
+    Rendered images cache with a size cap and LRU eviction
+    """
+
+    # default cache directory
+    DEFAULT_DIR = user_cache_dir('images')
+
+    # default max size of the cache (in MB)
+    DEFAULT_SIZE = 512
+
+    # extensions of the cached images
+    EXTENSIONS = ('.png', '.webp')
+
+    # bump when the way images are produced changes, to invalidate old entries
+    VERSION = 1
+
+    def __init__(self, directory = DEFAULT_DIR, max_size = DEFAULT_SIZE):
+        self.directory = directory
+        self.max_size = max_size * 2**20
+        self.size = None
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(html, settings = ''):
+        """
+        Get cache key for a render
+        - html: final html passed to the renderer
+        - settings: renderer settings that change the output
+        - returns: hex digest
+        """
+        digest = hashlib.sha256(f'{RenderCache.VERSION}\n{settings}\n'.encode('utf-8'))
+        digest.update(html.encode('utf-8'))
+        return digest.hexdigest()
+
+    def __entry(self, key, extension):
+        return os.path.join(self.directory, key[:2], f'{key}{extension}')
+
+    def fetch(self, key, destination):
+        """
+        Copy (or hardlink) a cached image to destination
+        - key: cache key
+        - destination: image file to write
+        - returns: True if the image was in the cache, False otherwise
+        """
+        entry = self.__entry(key, os.path.splitext(destination)[1])
+        try:
+            link_or_copy(entry, destination)
+        except FileNotFoundError:
+            return False
+        # mark as recently used
+        os.utime(entry)
+        return True
+
+    def store(self, key, source):
+        """
+        Store a rendered image in the cache
+        - key: cache key
+        - source: rendered image file
+        """
+        entry = self.__entry(key, os.path.splitext(source)[1])
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        link_or_copy(source, entry)
+        with self.lock:
+            if self.size is None:
+                self.size = sum(size for _, size, _ in self.__entries())
+            else:
+                self.size += os.path.getsize(entry)
+            if self.size > self.max_size:
+                self.__evict()
+
+    def __entries(self):
+        """
+        List cached images
+        - returns: list of (path, size, last use)
+        """
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for folder in os.scandir(self.directory):
+            if not folder.is_dir():
+                continue
+            for file in os.scandir(folder.path):
+                if file.name.endswith(RenderCache.EXTENSIONS):
+                    stat = file.stat()
+                    entries.append((file.path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def __evict(self):
+        """
+        Remove least recently used images until the cache is under 90% of its max size
+        """
+        entries = sorted(self.__entries(), key=lambda entry: entry[2])
+        self.size = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if self.size <= self.max_size * 0.9:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.size -= size
+
+    def clear(self):
+        """
+        Remove every cached image
+        """
+        with self.lock:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.size = 0
@@ -0,0 +1,369 @@
+"""
+Headless Chrome renderer driven through the Chrome DevTools Protocol
+- ChromeRenderer: long-lived headless browser with a pool of warm pages
+- ChromePage: browser tab used to load html and capture screenshots
+"""
+
+import io
+import base64
+import itertools
+import json
+import os
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.request
+
+from contextlib import contextmanager
+from pathlib import Path
+
+from html2image.browsers.search_utils import find_chrome
+from websocket import create_connection
+
+from actirepo.render.renderer import Renderer
+from actirepo.utils.profiler import span
+
+class ChromePage:
+    """
+    Browser tab connected through its own DevTools websocket
+    """
+
+    def __init__(self, ws_url, html_file, timeout):
+        self.ws = create_connection(ws_url, timeout=timeout, suppress_origin=True)
+        self.html_file = html_file
+        self.timeout = timeout
+        self.ids = itertools.count(1)
+        self.events = []
+        self.send('Page.enable')
+        # transparent background, so blank space can be trimmed from screenshots
+        self.send('Emulation.setDefaultBackgroundColorOverride', color={ 'r': 0, 'g': 0, 'b': 0, 'a': 0 })
+
+    def send(self, method, **params):
+        """
+        Send a DevTools command and wait for its result
+        - method: DevTools method name
+        - params: method parameters
+        - returns: result of the command
+        """
+        id = next(self.ids)
+        self.ws.send(json.dumps({ 'id': id, 'method': method, 'params': params }))
+        while True:
+            message = json.loads(self.ws.recv())
+            if message.get('id') == id:
+                if 'error' in message:
+                    raise RuntimeError(f"Chrome error on {method}: {message['error'].get('message')}")
+                return message.get('result', {})
+            # keep events received while waiting for the result
+            if 'method' in message:
+                self.events.append(message['method'])
+
+    def wait_event(self, method):
+        """
+        Wait for a DevTools event
+        - method: event name
+        """
+        deadline = time.monotonic() + self.timeout
+        while method not in self.events:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Chrome did not send {method} in {self.timeout} s")
+            message = json.loads(self.ws.recv())
+            if 'method' in message:
+                self.events.append(message['method'])
+        self.events.clear()
+
+    def load(self, html, size):
+        """
+        Load html in page
+        - html: html string
+        - size: viewport size (width, height)
+        """
+        with open(self.html_file, 'w', encoding='utf-8') as outfile:
+            outfile.write(html)
+        self.send('Emulation.setDeviceMetricsOverride', width=size[0], height=size[1], deviceScaleFactor=1, mobile=False)
+        self.events.clear()
+        self.send('Page.navigate', url=Path(self.html_file).as_uri())
+        self.wait_event('Page.loadEventFired')
+
+    def evaluate(self, expression):
+        """
+        Evaluate a javascript expression in page
+        - expression: javascript expression
+        - returns: value of the expression (converted to json)
+        """
+        result = self.send('Runtime.evaluate', expression=expression, returnByValue=True)
+        if 'exceptionDetails' in result:
+            raise RuntimeError(f"Javascript error: {result['exceptionDetails'].get('text')}")
+        return result['result'].get('value')
+
+    def screenshot(self, clip = None):
+        """
+        Capture current viewport, or a region of the page
+        - clip: region to capture (x, y, width, height), even beyond the viewport; None for the whole viewport
+        - returns: png image bytes
+        """
+        if clip is None:
+            result = self.send('Page.captureScreenshot', format='png')
+        else:
+            x, y, width, height = clip
+            result = self.send('Page.captureScreenshot', format='png', captureBeyondViewport=True,
+                               clip={ 'x': x, 'y': y, 'width': width, 'height': height, 'scale': 1 })
+        return base64.b64decode(result['data'])
+
+    def close(self):
+        try:
+            self.ws.close()
+        except Exception:
+            pass
+
+class ChromeRenderer(Renderer):
+    """
+    Headless Chrome launched once and reused for every screenshot
+    """
+
+    # default window size (same as html2image)
+    SIZE = (1920, 1080)
+
+    # seconds to wait for the browser to answer
+    TIMEOUT = 60
+
+    # screenshots are clipped to the question container, there is no blank space to crop
+    CLIPPED = True
+
+    # bounding box (x, y, width, height) of the first visible element of a root (the body or a shadow root) and everything in it, or null if it is empty
+    CLIP_FUNCTION = """
+        (root => {
+            const container = Array.from(root.children).find(element => ![ 'STYLE', 'SCRIPT', 'LINK', 'META' ].includes(element.tagName));
+            if (!container) return null;
+            let { left, top, right, bottom } = container.getBoundingClientRect();
+            for (const element of container.querySelectorAll('*')) {
+                const rect = element.getBoundingClientRect();
+                if (rect.width > 1 && rect.height > 1) {
+                    left = Math.min(left, rect.left);
+                    top = Math.min(top, rect.top);
+                    right = Math.max(right, rect.right);
+                    bottom = Math.max(bottom, rect.bottom);
+                }
+            }
+            left = Math.max(0, Math.floor(left + window.scrollX));
+            top = Math.max(0, Math.floor(top + window.scrollY));
+            right = Math.ceil(right + window.scrollX);
+            bottom = Math.ceil(bottom + window.scrollY);
+            return right > left && bottom > top ? [ left, top, right - left, bottom - top ] : null;
+        })
+    """
+
+    # bounding box of the question in the page
+    CLIP_SCRIPT = f"{CLIP_FUNCTION}(document.body)"
+
+    # bounding box of the question in each item of a batch
+    BATCH_CLIP_SCRIPT = f"Array.from(document.querySelectorAll('body > .actirepo-item')).map(item => {CLIP_FUNCTION}(item.shadowRoot))"
+
+    # border box size of the first element of every measured fragment
+    MEASURE_SCRIPT = """
+        Array.from(document.body.children).map(container => {
+            const rect = container.firstElementChild.getBoundingClientRect();
+            return [ Math.ceil(rect.width), Math.ceil(rect.height) ];
+        })
+    """
+
+    def __init__(self, pages = 1, executable = None, size = SIZE, timeout = TIMEOUT):
+        self.pages = max(1, int(pages))
+        self.executable = executable
+        self.size = size
+        self.timeout = timeout
+        self.process = None
+        # pages and assets are written here (the browser profile too, once it is launched)
+        self.tmp_dir = tempfile.mkdtemp(prefix='actirepo-')
+        self.port = None
+        self.pool = queue.Queue()
+        self.lock = threading.Lock()
+
+    def start(self):
+        """
+        Launch the browser and open the warm pages (only once)
+        """
+        with self.lock:
+            if self.process:
+                return
+            profile_dir = os.path.join(self.tmp_dir, 'profile')
+            command = [
+                find_chrome(self.executable),
+                '--headless',
+                '--remote-debugging-port=0',
+                '--remote-allow-origins=*',
+                f'--user-data-dir={profile_dir}',
+                '--hide-scrollbars',
+                '--default-background-color=00000000',
+                '--no-first-run',
+                '--no-default-browser-check',
+                '--disable-gpu',
+                '--allow-file-access-from-files',
+            ]
+            # chrome refuses to run as root with the sandbox enabled
+            if hasattr(os, 'geteuid') and os.geteuid() == 0:
+                command.append('--no-sandbox')
+            command.append('about:blank')
+            with span('chrome.launch', pages=self.pages):
+                self.process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                self.port = self.__wait_port(os.path.join(profile_dir, 'DevToolsActivePort'))
+                for index in range(self.pages):
+                    self.pool.put(self.__open_page(index))
+
+    def __wait_port(self, port_file):
+        """
+        Wait for the browser to publish its DevTools port
+        - port_file: DevToolsActivePort file written by chrome
+        - returns: DevTools port
+        """
+        deadline = time.monotonic() + self.timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Chrome exited with code {self.process.returncode}")
+            if os.path.isfile(port_file):
+                with open(port_file, 'r') as infile:
+                    lines = infile.read().splitlines()
+                if lines and lines[0].isdigit():
+                    return int(lines[0])
+            time.sleep(0.05)
+        raise TimeoutError(f"Chrome did not start in {self.timeout} s")
+
+    def __open_page(self, index):
+        """
+        Open a new browser tab
+        - index: page number (used to name its html file)
+        - returns: ChromePage
+        """
+        request = urllib.request.Request(f'http://127.0.0.1:{self.port}/json/new?about:blank', method='PUT')
+        # never route the local DevTools endpoint through a proxy
+        opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+        with opener.open(request, timeout=self.timeout) as response:
+            target = json.loads(response.read())
+        html_file = os.path.join(self.tmp_dir, f'page{index}.html')
+        return ChromePage(target['webSocketDebuggerUrl'], html_file, self.timeout)
+
+    @property
+    def asset_dir(self):
+        """
+        Directory of the files referenced by the rendered html (next to the pages, so they are referenced by a relative url)
+        """
+        return os.path.join(self.tmp_dir, 'assets')
+
+    @property
+    def settings(self):
+        """
+        Settings that change the rendered images (part of the cache key)
+        """
+        return f'chrome {self.size[0]}x{self.size[1]} clip'
+
+    @contextmanager
+    def page(self):
+        """
+        Borrow a warm page from the pool (waits until one is free)
+        """
+        self.start()
+        with span('chrome.wait_page'):
+            page = self.pool.get()
+        try:
+            yield page
+        finally:
+            self.pool.put(page)
+
+    def screenshot(self, html, size = None):
+        """
+        Render html and capture its container (only its bounding box is rasterized and encoded)
+        - html: html string
+        - size: window size (width, height), used for the layout
+        - returns: png image bytes
+        """
+        with self.page() as page:
+            with span('chrome.load'):
+                page.load(ChromeRenderer.prepare_html(html), size or self.size)
+            with span('chrome.capture'):
+                clip = page.evaluate(ChromeRenderer.CLIP_SCRIPT)
+                if clip is None:
+                    # nothing to clip to (e.g. text right in the body), the viewport is captured and cropped to its content
+                    return ChromeRenderer.crop(page.screenshot())
+                return page.screenshot(clip)
+
+    def screenshot_many(self, htmls, size = None):
+        """
+        Render many htmls in a single page load and capture each one in its own image.
+        Each html is isolated in a shadow root (as wide as the body of a single render), so its styles and layout are the same as when it is rendered alone.
+        - htmls: list of html strings
+        - size: window size (width, height), used for the layout
+        - returns: list of png image bytes, one for each html
+        """
+        if len(htmls) < 2:
+            return [ self.screenshot(html, size) for html in htmls ]
+        items = ''.join(f'<div class="actirepo-item" style="display:flow-root;"><template shadowrootmode="open" shadowroot="open">{html}</template></div>\n' for html in htmls)
+        with self.page() as page:
+            with span('chrome.load', images=len(htmls)):
+                page.load(ChromeRenderer.prepare_html(items), size or self.size)
+            clips = page.evaluate(ChromeRenderer.BATCH_CLIP_SCRIPT)
+            pngs = []
+            for html, clip in zip(htmls, clips):
+                if clip is None:
+                    # nothing visible to clip, captured alone as a single render
+                    pngs.append(None)
+                    continue
+                with span('chrome.capture'):
+                    pngs.append(page.screenshot(clip))
+        return [ png if png is not None else self.screenshot(html, size) for html, png in zip(htmls, pngs) ]
+
+    @staticmethod
+    def crop(png):
+        """
+        Crop a screenshot to its content (blank space is transparent)
+        - png: png image bytes
+        - returns: png image bytes (a single transparent pixel if there is no content)
+        """
+        from PIL import Image
+        with Image.open(io.BytesIO(png)) as im:
+            box = im.getbbox()
+            im = im.crop(box) if box else Image.new('RGBA', (1, 1), (0, 0, 0, 0))
+            output = io.BytesIO()
+            # the encoder of the session encodes the image again
+            im.save(output, format='png', compress_level=1)
+        return output.getvalue()
+
+    def measure(self, fragments):
+        """
+        Measure many html fragments in a single page load
+        - fragments: list of html fragments (the first element of each one is measured)
+        - returns: list of sizes { "width": int, "height": int }
+        """
+        html = ''.join(f'<div>{fragment}</div>' for fragment in fragments)
+        with self.page() as page:
+            page.load(ChromeRenderer.prepare_html(html), self.size)
+            sizes = page.evaluate(ChromeRenderer.MEASURE_SCRIPT)
+        return [ { "width": width, "height": height } for width, height in sizes ]
+
+    def close(self):
+        """
+        Close pages and shut down the browser
+        """
+        with self.lock:
+            while not self.pool.empty():
+                self.pool.get().close()
+            if self.process:
+                self.process.terminate()
+                try:
+                    self.process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    self.process.kill()
+                self.process = None
+            if self.tmp_dir:
+                shutil.rmtree(self.tmp_dir, ignore_errors=True)
+                self.tmp_dir = None
+
+    @staticmethod
+    def prepare_html(html):
+        """
+        Wrap an html fragment in a full document (as html2image does)
+        - html: html fragment
+        - returns: html document
+        """
+        return f'<html>\n<head>\n<meta charset="UTF-8">\n</head>\n<body>\n{html}\n</body>\n</html>\n'
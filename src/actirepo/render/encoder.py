@@ -0,0 +1,155 @@
+"""
+Post-processing of the rendered images: crop, quantize and encode them in memory, in the background
+- ImageEncoder: turns screenshots into image files (png or webp), optionally in background threads
+"""
+
+import io
+import os
+import threading
+
+from actirepo.utils.profiler import span
+
+class ImageEncoder:
+    """
+    Crops screenshots to their content and encodes them once, with the chosen format and options.
+    With workers, images are written by background threads, so the renderer goes on with the next question meanwhile.
+    """
+
+    # output formats and their file extensions
+    FORMATS = {
+        'png': '.png',
+        'webp': '.webp'
+    }
+
+    # default output format
+    DEFAULT_FORMAT = 'png'
+
+    # default png compression level (zlib, 0-9)
+    DEFAULT_COMPRESSION = 6
+
+    def __init__(self, format = DEFAULT_FORMAT, compression = DEFAULT_COMPRESSION, optimize = False, colors = 0, quality = None, workers = 1):
+        """
+        - format: output format (one of FORMATS)
+        - compression: png compression level (0-9)
+        - optimize: if true, search the smallest png encoding (slower)
+        - colors: if not 0, quantize images to a palette of this number of colors
+        - quality: webp quality (0-100), or None for lossless webp
+        - workers: background threads that encode images (0 to encode them in the calling thread)
+        """
+        if not format in ImageEncoder.FORMATS:
+            raise ValueError(f'Unknown image format {format}. Available formats: {", ".join(ImageEncoder.FORMATS)}')
+        self.format = format
+        self.compression = compression
+        self.optimize = optimize
+        self.colors = colors
+        self.quality = quality
+        self.workers = workers
+        self.executor = None
+        self.pending = set()
+        self.lock = threading.Lock()
+
+    @property
+    def extension(self):
+        """
+        Extension of the image files
+        """
+        return ImageEncoder.FORMATS[self.format]
+
+    @property
+    def settings(self):
+        """
+        Settings that change the encoded images (part of the cache key, empty for the defaults)
+        """
+        settings = []
+        if self.format != ImageEncoder.DEFAULT_FORMAT:
+            settings.append(self.format)
+        if self.format == 'png' and self.compression != ImageEncoder.DEFAULT_COMPRESSION:
+            settings.append(f'compression={self.compression}')
+        if self.format == 'png' and self.optimize:
+            settings.append('optimize')
+        if self.colors:
+            settings.append(f'colors={self.colors}')
+        if self.format == 'webp':
+            settings.append('lossless' if self.quality is None else f'quality={self.quality}')
+        return ' '.join(settings)
+
+    def encode(self, screenshot, crop = True):
+        """
+        Crop a screenshot to its content and encode it
+        - screenshot: png image bytes (blank space is transparent)
+        - crop: if false, the screenshot is already clipped to its content
+        - returns: encoded image bytes
+        """
+        from PIL import Image
+        with Image.open(io.BytesIO(screenshot)) as im:
+            if crop:
+                im = im.crop(im.getbbox())
+            if self.colors:
+                # fast octree quantization keeps the alpha channel
+                im = im.quantize(self.colors, method=Image.Quantize.FASTOCTREE)
+            output = io.BytesIO()
+            if self.format == 'webp':
+                if self.quality is None:
+                    im.save(output, format='webp', lossless=True)
+                else:
+                    im.save(output, format='webp', quality=self.quality)
+            else:
+                im.save(output, format='png', compress_level=self.compression, optimize=self.optimize)
+        return output.getvalue()
+
+    def write(self, screenshot, path, callback = None, crop = True):
+        """
+        Encode a screenshot to an image file (in the background if there are workers)
+        - screenshot: png image bytes
+        - path: image file
+        - callback: function called with path once the file is written
+        - crop: if false, the screenshot is already clipped to its content
+        - returns: future of the background write (to be passed to wait), or None if the file is already written
+        """
+        if not self.workers:
+            self.__write(screenshot, path, callback, crop)
+            return None
+        from concurrent.futures import ThreadPoolExecutor
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='actirepo-encoder')
+            future = self.executor.submit(self.__write, screenshot, path, callback, crop)
+            self.pending.add(future)
+        return future
+
+    def __write(self, screenshot, path, callback, crop):
+        with span('image.encode', file=os.path.basename(path)):
+            data = self.encode(screenshot, crop)
+        # write to a temporary file first, the image may be a hardlink to a cached one
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as outfile:
+            outfile.write(data)
+        os.replace(tmp_path, path)
+        if callback:
+            callback(path)
+
+    def wait(self, futures = None):
+        """
+        Wait until images are written (errors of their background writes are raised here).
+        The encoder is shared by the whole session, so each caller waits only for the images it wrote.
+        - futures: futures returned by write (None values are skipped), or None to wait for every pending image
+        """
+        with self.lock:
+            if futures is None:
+                futures, self.pending = list(self.pending), set()
+            else:
+                futures = [ future for future in futures if future is not None ]
+                self.pending.difference_update(futures)
+        for future in futures:
+            future.result()
+
+    def close(self):
+        """
+        Wait for the pending images and stop the workers
+        """
+        try:
+            self.wait()
+        finally:
+            if self.executor:
+                self.executor.shutdown()
+                self.executor = None
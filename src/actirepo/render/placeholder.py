@@ -0,0 +1,159 @@
+"""
+Chrome-free renderer that draws deterministic placeholder images with PIL
+- PlaceholderRenderer: draws the text of the question in a box, without a browser
+"""
+
+import io
+import unicodedata
+
+from html.parser import HTMLParser
+
+from PIL import Image, ImageDraw, ImageFont
+
+from actirepo.render.renderer import Renderer
+
+class TextExtractor(HTMLParser):
+    """
+    Collects the visible text of an html fragment
+    """
+
+    # elements whose content is not visible
+    HIDDEN = { 'style', 'script', 'head', 'title' }
+
+    # elements that start a new line
+    BLOCKS = { 'br', 'div', 'p', 'li', 'ul', 'ol', 'fieldset', 'legend', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'table', 'tr' }
+
+    def __init__(self):
+        super().__init__()
+        self.parts = []
+        self.hidden = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in TextExtractor.HIDDEN:
+            self.hidden += 1
+        elif tag in TextExtractor.BLOCKS:
+            self.parts.append('\n')
+
+    def handle_endtag(self, tag):
+        if tag in TextExtractor.HIDDEN and self.hidden > 0:
+            self.hidden -= 1
+        elif tag in TextExtractor.BLOCKS:
+            self.parts.append('\n')
+
+    def handle_data(self, data):
+        if not self.hidden:
+            self.parts.append(data)
+
+    @staticmethod
+    def paragraphs(html):
+        """
+        Get the visible text of html, split in paragraphs
+        - html: html string
+        - returns: list of paragraphs, with whitespace collapsed
+        """
+        extractor = TextExtractor()
+        extractor.feed(html)
+        extractor.close()
+        paragraphs = [ ' '.join(paragraph.split()) for paragraph in ' '.join(extractor.parts).split('\n') ]
+        return [ paragraph for paragraph in paragraphs if paragraph ]
+
+class PlaceholderRenderer(Renderer):
+    """
+    Draws the text of the html in a box the width of the question templates.
+    It is fast and needs no browser (useful for bulk builds and tests), but it is only a preview of the layout.
+    """
+
+    # images are the question box, there is no blank space to crop
+    CLIPPED = True
+
+    # width of the question box (same as the question templates)
+    WIDTH = 800
+
+    # padding of the question box
+    PADDING = 12
+
+    # fonts tried in order (Pillow's embedded font, used as fallback, has no accented letters)
+    FONTS = [ 'DejaVuSans.ttf', 'LiberationSans-Regular.ttf', 'Arial.ttf', 'arial.ttf', 'Helvetica.ttc' ]
+
+    # font size and line height
+    FONT_SIZE = 13
+    LINE_HEIGHT = 16
+
+    # colors (same as the question templates)
+    BACKGROUND = (231, 243, 245, 255)
+    FOREGROUND = (0, 26, 30, 255)
+
+    # padding and border of measured boxes (same as the drag items)
+    BOX_PADDING = 5
+    BOX_BORDER = 1
+
+    def __init__(self, pages = 1):
+        # pages are ignored, there is no browser
+        self.font = None
+        for font in PlaceholderRenderer.FONTS:
+            try:
+                self.font = ImageFont.truetype(font, PlaceholderRenderer.FONT_SIZE)
+                break
+            except OSError:
+                continue
+        self.ascii_only = self.font is None
+        if self.ascii_only:
+            self.font = ImageFont.load_default(size=PlaceholderRenderer.FONT_SIZE)
+
+    @property
+    def settings(self):
+        return f'placeholder {PlaceholderRenderer.WIDTH} {PlaceholderRenderer.FONT_SIZE} {" ".join(self.font.getname())}'
+
+    def __paragraphs(self, html):
+        """
+        Get the paragraphs of html that can be drawn with the font
+        - html: html string
+        - returns: list of paragraphs
+        """
+        paragraphs = TextExtractor.paragraphs(html)
+        if self.ascii_only:
+            # drop accents instead of drawing missing glyphs
+            paragraphs = [ unicodedata.normalize('NFKD', paragraph).encode('ascii', 'ignore').decode('ascii') for paragraph in paragraphs ]
+        return paragraphs
+
+    def __wrap(self, text, width):
+        """
+        Split text in lines that fit in width
+        - text: text to wrap
+        - width: max width in pixels
+        - returns: list of lines
+        """
+        lines = []
+        line = ''
+        for word in text.split():
+            candidate = f'{line} {word}' if line else word
+            if line and self.font.getlength(candidate) > width:
+                lines.append(line)
+                line = word
+            else:
+                line = candidate
+        if line:
+            lines.append(line)
+        return lines
+
+    def screenshot(self, html, size = None):
+        text_width = PlaceholderRenderer.WIDTH - 2 * PlaceholderRenderer.PADDING
+        lines = [ line for paragraph in self.__paragraphs(html) for line in self.__wrap(paragraph, text_width) ] or [ '' ]
+        height = len(lines) * PlaceholderRenderer.LINE_HEIGHT + 2 * PlaceholderRenderer.PADDING
+        image = Image.new('RGBA', (PlaceholderRenderer.WIDTH, height), PlaceholderRenderer.BACKGROUND)
+        draw = ImageDraw.Draw(image)
+        for index, line in enumerate(lines):
+            position = (PlaceholderRenderer.PADDING, PlaceholderRenderer.PADDING + index * PlaceholderRenderer.LINE_HEIGHT)
+            draw.text(position, line, font=self.font, fill=PlaceholderRenderer.FOREGROUND)
+        png = io.BytesIO()
+        image.save(png, format='png')
+        return png.getvalue()
+
+    def measure(self, fragments):
+        extra = 2 * (PlaceholderRenderer.BOX_PADDING + PlaceholderRenderer.BOX_BORDER)
+        return [
+            {
+                "width": round(self.font.getlength(' '.join(self.__paragraphs(fragment)))) + extra,
+                "height": PlaceholderRenderer.LINE_HEIGHT + extra
+            } for fragment in fragments
+        ]
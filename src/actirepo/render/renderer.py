@@ -0,0 +1,63 @@
+"""
+Rendering backends interface
+- Renderer: renders html to images and measures html fragments
+"""
+
+from abc import ABC, abstractmethod
+
+class Renderer(ABC):
+    """
+    Renderer class: turns question html into images
+    """
+
+    # true if screenshots are already clipped to their content (they are not cropped afterwards)
+    CLIPPED = False
+
+    @property
+    def asset_dir(self):
+        """
+        Directory of the files referenced by the rendered html, relative to its pages (None if the renderer does not load them)
+        """
+        return None
+
+    @property
+    @abstractmethod
+    def settings(self):
+        """
+        Settings that change the rendered images (part of the cache key)
+        """
+        pass
+
+    @abstractmethod
+    def screenshot(self, html, size = None):
+        """
+        Render html
+        - html: html string
+        - size: window size (width, height)
+        - returns: png image bytes (blank space is transparent, unless the renderer is CLIPPED)
+        """
+        pass
+
+    def screenshot_many(self, htmls, size = None):
+        """
+        Render many htmls, each one in its own image (renderers may load them all at once)
+        - htmls: list of html strings
+        - size: window size (width, height)
+        - returns: list of png image bytes, one for each html
+        """
+        return [ self.screenshot(html, size) for html in htmls ]
+
+    @abstractmethod
+    def measure(self, fragments):
+        """
+        Measure many html fragments at once
+        - fragments: list of html fragments (the first element of each one is measured)
+        - returns: list of sizes { "width": int, "height": int }
+        """
+        pass
+
+    def close(self):
+        """
+        Release the resources of the renderer
+        """
+        pass
@@ -0,0 +1,160 @@
+"""
+Rendering session shared by the whole run
+- start: open the rendering session (the browser is launched on first use)
+- get_renderer: get the renderer of the current session (opening a default one if needed)
+- get_cache: get the rendered images cache of the current session (None if disabled)
+- get_encoder: get the image encoder of the current session (opening a default one if needed)
+- get_batch: get the number of questions rendered in each page load
+- get_assets: get the asset store of the current session (None if embedded files are inlined)
+- get_refresh: check if every question is rendered again, ignoring the images already generated
+- stop: shut down the rendering session
+- session: context manager that opens and closes the rendering session
+"""
+
+import atexit
+import importlib
+import threading
+
+from contextlib import contextmanager
+
+from actirepo.render.assets import AssetStore, ASSET_MODES, DEFAULT_ASSET_MODE
+
+# available rendering engines (their modules are imported only when they are used)
+RENDERERS = {
+    'chrome': {
+        'module': 'actirepo.render.chrome',
+        'class': 'ChromeRenderer',
+        'description': 'Google Chrome/Chromium en modo headless'
+    },
+    'placeholder': {
+        'module': 'actirepo.render.placeholder',
+        'class': 'PlaceholderRenderer',
+        'description': 'imágenes de sustitución con el texto de la pregunta, sin navegador'
+    }
+}
+
+# default rendering engine
+DEFAULT_RENDERER = 'chrome'
+
+_renderer = None
+_cache = None
+_encoder = None
+_batch = 1
+_assets = None
+_refresh = False
+_lock = threading.Lock()
+
+def start(pages = 1, cache = None, renderer = DEFAULT_RENDERER, encoder = None, batch = 1, assets = DEFAULT_ASSET_MODE, refresh = False):
+    """
+    Open the rendering session
+    - pages: number of browser pages kept warm
+    - cache: rendered images cache (RenderCache), or None to always render
+    - renderer: rendering engine (one of RENDERERS)
+    - encoder: image encoder (ImageEncoder), or None for the default png encoder
+    - batch: number of questions rendered in each page load (1 to load each question alone)
+    - assets: how embedded files are passed to the renderer (one of ASSET_MODES)
+    - refresh: if true, render every question again (the manifests of the images already generated are ignored)
+    - returns: renderer
+    """
+    global _renderer, _cache, _encoder, _batch, _assets, _refresh
+    with _lock:
+        if _renderer is None:
+            if not renderer in RENDERERS:
+                raise ValueError(f'Unknown renderer {renderer}. Available renderers: {", ".join(RENDERERS)}')
+            module = importlib.import_module(RENDERERS[renderer]['module'])
+            _renderer = getattr(module, RENDERERS[renderer]['class'])(pages)
+            _cache = cache
+            _batch = max(1, int(batch))
+            _refresh = refresh
+            if not assets in ASSET_MODES:
+                raise ValueError(f'Unknown asset mode {assets}. Available modes: {", ".join(ASSET_MODES)}')
+            _assets = AssetStore(_renderer.asset_dir) if assets == 'files' else None
+            if encoder is not None:
+                _encoder = encoder
+        return _renderer
+
+def get_renderer():
+    """
+    Get the renderer of the current session
+    - returns: renderer
+    """
+    return _renderer or start()
+
+def get_cache():
+    """
+    Get the rendered images cache of the current session
+    - returns: RenderCache or None
+    """
+    return _cache
+
+def get_batch():
+    """
+    Get the number of questions rendered in each page load
+    """
+    return _batch
+
+def get_assets():
+    """
+    Get the asset store of the current session
+    - returns: AssetStore, or None if embedded files are inlined as data URIs
+    """
+    get_renderer()
+    return _assets
+
+def get_refresh():
+    """
+    Check if every question is rendered again, ignoring the images already generated
+    """
+    return _refresh
+
+def get_encoder():
+    """
+    Get the image encoder of the current session
+    - returns: ImageEncoder
+    """
+    global _encoder
+    if _encoder is None:
+        from actirepo.render.encoder import ImageEncoder
+        with _lock:
+            if _encoder is None:
+                _encoder = ImageEncoder()
+    return _encoder
+
+def stop():
+    """
+    Shut down the rendering session
+    """
+    global _renderer, _cache, _encoder, _batch, _assets, _refresh
+    with _lock:
+        _batch = 1
+        _refresh = False
+        _assets = None
+        # images still being encoded are written before leaving
+        if _encoder is not None:
+            _encoder.close()
+            _encoder = None
+        if _renderer is not None:
+            _renderer.close()
+            _renderer = None
+            _cache = None
+
+@contextmanager
+def session(pages = 1, cache = None, renderer = DEFAULT_RENDERER, encoder = None, batch = 1, assets = DEFAULT_ASSET_MODE, refresh = False):
+    """
+    Open a rendering session and close it on exit
+    - pages: number of browser pages kept warm
+    - cache: rendered images cache (RenderCache), or None to always render
+    - renderer: rendering engine (one of RENDERERS)
+    - encoder: image encoder (ImageEncoder), or None for the default png encoder
+    - batch: number of questions rendered in each page load (1 to load each question alone)
+    - assets: how embedded files are passed to the renderer (one of ASSET_MODES)
+    - refresh: if true, render every question again (the manifests of the images already generated are ignored)
+    """
+    start(pages, cache, renderer, encoder, batch, assets, refresh)
+    try:
+        yield get_renderer()
+    finally:
+        stop()
+
+# never leave a browser running when the interpreter exits
+atexit.register(stop)
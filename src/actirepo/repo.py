@@ -15,8 +15,8 @@ class Repo(Category):
     # repo file name
     METADATA_FILE = 'repo.json'
 
-    def __init__(self, path):
-        super().__init__(path)
+    def __init__(self, path, node = None):
+        super().__init__(path, node)
         self.type = "repository"
 
     @staticmethod
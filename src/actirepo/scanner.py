@@ -0,0 +1,87 @@
+"""
+Repository scanner: classifies a whole tree of artifacts in a single walk
+- Node: scanned directory
+- scan: scan a directory (and its subdirectories, if it is a category)
+"""
+
+import os
+
+from .moodle.quiz import Quiz
+
+class Node:
+    """
+    Scanned directory: its quiz files, its kind of artifact and its scanned subdirectories
+    """
+
+    def __init__(self, path):
+        self.path = os.path.normpath(path)
+        self.name = os.path.basename(self.path)
+        self.files = []
+        self.dirs = []
+        self.quiz_files = []
+        self.children = []
+        self.is_activity = False
+        self.is_category = False
+
+    def activities(self):
+        """
+        Get subdirectories that are activities
+        """
+        return [ child for child in self.children if child.is_activity ]
+
+    def categories(self):
+        """
+        Get subdirectories that are categories
+        """
+        return [ child for child in self.children if child.is_category ]
+
+    def __str__(self):
+        return f'{self.path}'
+
+    __repr__ = __str__
+
+def scan(path, recursive = True):
+    """
+    Scan a directory, listing every directory only once
+    - path: path to directory
+    - recursive: if true, scan subdirectories (and theirs, while they are categories)
+    - returns: Node
+    """
+    node = _scan_dir(path)
+    if recursive:
+        _scan_children(node)
+    return node
+
+def _scan_dir(path):
+    """
+    List a directory and classify it
+    - path: path to directory
+    - returns: Node (without children)
+    """
+    # avoid circular imports (artifacts are built from scanned nodes)
+    from .activity import Activity
+    from .category import Category
+    from .artifact import Artifact
+    node = Node(path)
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                node.dirs.append(entry.path)
+            else:
+                node.files.append(entry.name)
+    # quiz files are recognized by their root tag, without parsing the whole document
+    node.quiz_files = [ file for file in node.files if Quiz.is_quiz_file(os.path.join(path, file)) ]
+    node.is_activity = Activity.METADATA_FILE in node.files or len(node.quiz_files) > 0
+    # a folder that just contains folders is a category (its own README and hidden files do not count)
+    node.is_category = Category.METADATA_FILE in node.files or not any(file != Artifact.README and not file.startswith('.') for file in node.files)
+    return node
+
+def _scan_children(node):
+    """
+    Scan subdirectories of a node, going down through categories
+    - node: scanned directory
+    """
+    node.children = [ _scan_dir(dir) for dir in node.dirs ]
+    for child in node.children:
+        if child.is_category:
+            _scan_children(child)
@@ -4,10 +4,14 @@ File utilities.
 - is_newer_than: Check if file1 is newer than file2
 - slugify: Convert to ASCII if 'allow_unicode' is False. Convert spaces or repeated dashes to single dashes. Remove characters that aren't alphanumerics, underscores, or hyphens. Convert to lowercase. Also strip leading and trailing whitespace, dashes, and underscores.
 - anchorify: Creates a valid anchor from a string: Convert to lowercase. Remove characters that aren't alphanumerics, underscores, or hyphens. Convert spaces to hyphens. Also strip leading and trailing whitespace, dashes, and underscores.
+- user_cache_dir: Get the user cache directory for actirepo
+- link_or_copy: Hardlink a file, or copy it if hardlinks are not possible
 """
 import unicodedata
 import re
 import os
+import shutil
+import threading
 from pathlib import Path
 
 def remove_extension(filename):
@@ -19,20 +23,23 @@ def remove_extension(filename):
     return Path(filename).stem
 
 
-def get_available_filename(path, name):
+def get_available_filename(path, name, reserved = None):
     """
     Get the first available filename, searching for a valid and not existing filename by appending an index to the name.
-    - path: path to directory
+    - path: path to directory (None to only check reserved filenames)
     - name: name of the file
+    - reserved: set of filenames already taken but not written yet (the returned filename is added to it)
     - return: first available filename
     """
     index = 1
     basename = os.path.splitext(name)[0]
     extension = os.path.splitext(name)[1][1:] # get extension without dot
     valid_filename = f'{basename}_{index}.{extension}'
-    while os.path.exists(os.path.join(path, valid_filename)):
+    while (path is not None and os.path.exists(os.path.join(path, valid_filename))) or (reserved is not None and valid_filename in reserved):
         index += 1
         valid_filename = f'{basename}_{index}.{extension}'
+    if reserved is not None:
+        reserved.add(valid_filename)
     return valid_filename
 
 def slugify(value, allow_unicode=False):
@@ -63,13 +70,16 @@ def anchorify(value):
 
 def is_newer_than(tested_file, files):
     """
-    Check if file is newer than all files
-    Returns True if file is newer than all files; False otherwise.
+    Check if file is newer than all files (or directories)
+    Returns True if file is newer than all files; False otherwise (or if it does not exist).
     """
+    if not os.path.isfile(tested_file):
+        return False
+    mtime = os.path.getmtime(tested_file)
     for file in files:
-        if not os.path.isfile(file):
+        if not os.path.exists(file):
             continue
-        if os.path.getmtime(tested_file) < os.path.getmtime(file):
+        if mtime < os.path.getmtime(file):
             return False
     return True
 
@@ -81,3 +91,39 @@ def path_to_capitalized_list(path):
     """
     parts = path.split(os.sep)
     return [ part.capitalize() for part in parts[0:len(parts)-1] ]
+
+def user_cache_dir(*parts):
+    """
+    Get the user cache directory for actirepo (not created)
+    - parts: subdirectories inside the cache directory
+    - returns: path to the cache directory
+    """
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA', os.path.expanduser('~'))
+    else:
+        base = os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(base, 'actirepo', *parts)
+
+def link_or_copy(source, destination):
+    """
+    Hardlink a file, or copy it if hardlinks are not possible (the destination is replaced atomically)
+    - source: source file
+    - destination: destination file
+    """
+    # nothing to do if the destination is already a link to the source (renaming a link onto it would leave the temporary file)
+    try:
+        if os.path.samefile(source, destination):
+            return
+    except OSError:
+        pass
+    # the temporary name is unique to the thread, as several threads may store the same file at once
+    tmp = f'{destination}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        try:
+            os.link(source, tmp)
+        except OSError:
+            shutil.copyfile(source, tmp)
+        os.replace(tmp, destination)
+    finally:
+        if os.path.lexists(tmp):
+            os.remove(tmp)
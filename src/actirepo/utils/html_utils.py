@@ -0,0 +1,81 @@
+"""
+Functions for rewriting html without parsing the whole document
+- rewrite_images: rewrite the source (and class) of img tags in a single pass
+"""
+
+import re
+
+from html import unescape
+
+# img start tag (attribute values may contain '>')
+IMG_TAG = re.compile(r'''<img\b(?:[^>"']|"[^"]*"|'[^']*')*>''', re.IGNORECASE)
+
+# space (and stray slashes) between the attributes of a tag
+ATTRIBUTE_SEPARATOR = re.compile(r'[\s/]*')
+
+# attribute of a tag, with its optional (double quoted, single quoted or unquoted) value
+ATTRIBUTE = re.compile(r'''([^\s/>][^\s/>=]*)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+)))?''')
+
+def _attributes(tag):
+    """
+    Get the attributes of an img tag, walking them in order from the tag name (as browsers do, so text inside
+    the value of an attribute is never taken as another attribute)
+    - tag: img start tag
+    - return: dictionary of attribute matches by lowercase name (the first one of repeated attributes)
+    """
+    attributes = {}
+    # after '<img'
+    pos = 4
+    while True:
+        pos = ATTRIBUTE_SEPARATOR.match(tag, pos).end()
+        attribute = ATTRIBUTE.match(tag, pos)
+        if attribute is None:
+            return attributes
+        attributes.setdefault(attribute.group(1).lower(), attribute)
+        pos = attribute.end()
+
+def _value(attribute):
+    """
+    Get the raw value of an attribute match ('' if it has no value)
+    """
+    return next((group for group in attribute.groups()[1:] if group is not None), '')
+
+def rewrite_images(html, replace, css_class = None):
+    """
+    Rewrite the source of img tags in a single pass (the rest of the html is kept as is)
+    - html: html string
+    - replace: function that gets the source of an image (unescaped, without query or fragment) and returns its new source, or None to keep the tag unchanged
+    - css_class: class added to the rewritten tags
+    - return: rewritten html
+
+    >>> rewrite_images('<p><img src="a.png?v=1" alt="A">b</p>', lambda src: src.upper(), 'big')
+    '<p><img class="big" src="A.PNG" alt="A">b</p>'
+    >>> rewrite_images('<img alt="a src=x.png" src="y.png">', lambda src: 'new.png')
+    '<img alt="a src=x.png" src="new.png">'
+    >>> rewrite_images('<img src="y.png"class="a">', lambda src: 'new.png', 'big')
+    '<img src="new.png"class="a big">'
+    >>> rewrite_images('<img title=\\'1 > 0\\' src=y.png>', lambda src: None)
+    "<img title='1 > 0' src=y.png>"
+    """
+    def rewrite(match):
+        tag = match.group(0)
+        attributes = _attributes(tag)
+        src = attributes.get('src')
+        if src is None:
+            return tag
+        new_src = replace(re.split('[?#]', unescape(_value(src)), maxsplit=1)[0])
+        if new_src is None:
+            return tag
+        # attributes are replaced from the end of the tag, so the positions of the previous ones stay valid
+        edits = [ (src.start(), src.end(), f'src="{new_src}"') ]
+        if css_class:
+            classes = attributes.get('class')
+            if classes is None:
+                edits.append((4, 4, f' class="{css_class}"'))
+            else:
+                value = _value(classes)
+                edits.append((classes.start(), classes.end(), f'class="{value} {css_class}"' if value.strip() else f'class="{css_class}"'))
+        for start, end, text in sorted(edits, reverse=True):
+            tag = tag[:start] + text + tag[end:]
+        return tag
+    return IMG_TAG.sub(rewrite, html)
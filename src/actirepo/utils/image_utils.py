@@ -1,61 +1,228 @@
 """
 Functions for rendering html to images and getting the size of the html
+- html_key: Get the key of the image rendered from html
+- html2png: Render html to an image file (png or webp, as set by the encoder of the session)
+- htmls2png: Render many htmls to image files, loading them in a single page
+- text_sizes: Get the size of many texts (measured together, and remembered)
+- get_image_size: Get image size from file
+- probe_image_size: Get image size from the header of an image (PNG, JPEG, GIF or SVG)
 """
 
-import contextlib
 import os
-import tempfile
 import io
+import re
 import base64
+import struct
+import binascii
+import threading
 
-from html2image import Html2Image
 from PIL import Image
 
+from actirepo.render.cache import RenderCache
+from actirepo.render.session import get_renderer, get_cache, get_encoder
+from actirepo.utils.profiler import span
+
+# sizes already measured, by (text, style)
+_text_sizes = {}
+_text_sizes_lock = threading.Lock()
+
+def html_key(html):
+    """
+    Get the key of the image rendered from html (same key, same image)
+    - html: html string
+    - return: hex digest
+    """
+    settings = [ get_renderer().settings, get_encoder().settings ]
+    return RenderCache.key(html, ' '.join(setting for setting in settings if setting))
+
 def html2png(html, destination_dir, img_file):
     """
-    Render html to png image
+    Render html to an image file (reusing the cached image if the same html was already rendered).
+    The screenshot is cropped and encoded by the encoder of the session, in the background if it has workers
+    (pass the returned writes to get_encoder().wait() before using the image).
     - html: html string
     - destination_dir: destination directory
-    - img_file: image file name
+    - img_file: image file name (its extension should be the one of the encoder)
+    - return: list of background writes (futures)
     """
-    hti = Html2Image()
-    hti.output_path = destination_dir
-    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
-        img_file = hti.screenshot(html_str=html, save_as=img_file)[0]
-    im = Image.open(img_file)
-    im = im.crop(im.getbbox())
-    im.save(img_file)
+    return htmls2png([ html ], destination_dir, [ img_file ])
 
-def htmlsize(html):
+def htmls2png(htmls, destination_dir, img_files):
     """
-    Get the size of the html
-    - html: html string
-    - return: dictionary with width and height {"width": width, "height": height}
-    """
-    tmp = tempfile.mkstemp(suffix='.png')
-    os.close(tmp[0])
-    file = tmp[1]
-    html2png(html, os.path.dirname(file), os.path.basename(file))
-    im = Image.open(file)
-    size = im.size
-    im.close()
-    os.remove(file)
+    Render many htmls to image files, loading the ones that are not cached in a single page
+    (same images as rendering each one with html2png)
+    - htmls: list of html strings
+    - destination_dir: destination directory
+    - img_files: list of image file names, one for each html
+    - return: list of background writes (futures, to be passed to get_encoder().wait())
+    """
+    renderer = get_renderer()
+    cache = get_cache()
+    os.makedirs(destination_dir, exist_ok=True)
+    pending = []
+    for html, img_file in zip(htmls, img_files):
+        img_path = os.path.join(destination_dir, img_file)
+        key = html_key(html) if cache else None
+        if cache:
+            with span('cache.fetch'):
+                if cache.fetch(key, img_path):
+                    continue
+        pending.append((html, img_path, key))
+    if not pending:
+        return []
+    with span('render.screenshot', images=len(pending)):
+        pngs = renderer.screenshot_many([ html for html, _, _ in pending ])
+    encoder = get_encoder()
+    # the cache gets each image once it is written
+    return [ encoder.write(png, img_path, (lambda path, key = key: cache.store(key, path)) if cache else None, crop=not renderer.CLIPPED)
+             for png, (_, img_path, key) in zip(pngs, pending) ]
+
+def text_sizes(texts, style):
+    """
+    Get the size of many texts, each one rendered in a box with the given style.
+    Texts not measured before are laid out together in a single page, and sizes are remembered for the whole run.
+    - texts: list of texts (html allowed)
+    - style: css style of the box
+    - return: list of dictionaries with width and height {"width": width, "height": height}
+    """
+    with _text_sizes_lock:
+        missing = list(dict.fromkeys(text for text in texts if (text, style) not in _text_sizes))
+    if missing:
+        with span('render.measure', texts=len(missing)):
+            sizes = get_renderer().measure([ f'<div style="{style}">{text}</div>' for text in missing ])
+        with _text_sizes_lock:
+            for text, size in zip(missing, sizes):
+                _text_sizes[(text, style)] = size
+    return [ _text_sizes[(text, style)] for text in texts ]
+
+def get_image_size(file):
+    """
+    Get image size from file (only the header is decoded, unless the format is unknown)
+    file: embedded file (base64 encoded data)
+    return { "width": int, "height": int }, or None if the file is empty or its size cannot be read
+    (e.g. an SVG without absolute width and height)
+    """
+    if file is None or not file.data:
+        return None
+    data = file.data
+    # base64 may be split in lines (of a fixed width, so they show up at the start), and offsets must be counted without them
+    if any(space in data[:1024] for space in ' \t\r\n'):
+        data = ''.join(data.split())
+    size = probe_image_size(Base64Reader(data))
+    if size is None:
+        try:
+            with Image.open(io.BytesIO(base64.b64decode(data))) as img:
+                size = img.size
+        except (OSError, ValueError):
+            # not an image PIL can open (UnidentifiedImageError is an OSError), or not valid base64
+            return None
     return {
         "width": size[0],
         "height": size[1]
     }
 
-def get_image_size(file):
+class Base64Reader:
+    """
+    Random access to the bytes encoded in a base64 string, decoding only the requested ranges
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.length = len(data) // 4 * 3 - data[-2:].count('=')
+
+    def read(self, start, length):
+        """
+        Decode a range of bytes
+        - start: offset of the first byte
+        - length: number of bytes
+        - return: bytes (fewer than length at the end of the data)
+        """
+        if start >= self.length:
+            return b''
+        first = start // 3
+        last = (min(start + length, self.length) + 2) // 3
+        try:
+            chunk = base64.b64decode(self.data[first * 4:last * 4])
+        except binascii.Error:
+            return b''
+        return chunk[start - first * 3:start - first * 3 + length]
+
+# size attributes of the root svg element
+SVG_TAG = re.compile(rb'<svg\b[^>]*>', re.IGNORECASE | re.DOTALL)
+SVG_ATTRIBUTE = re.compile(rb'\s(width|height|viewBox)\s*=\s*["\']([^"\']*)["\']', re.IGNORECASE)
+SVG_LENGTH = re.compile(rb'^\s*([0-9]*\.?[0-9]+)\s*(px)?\s*$')
+
+# JPEG markers of the frame header, that holds the size (SOF0-SOF15, except DHT, JPG and DAC)
+JPEG_SOF = { 0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF }
+
+def probe_image_size(reader):
+    """
+    Get image size from the header of an image, reading as few bytes as possible
+    - reader: object with a read(start, length) method returning bytes (e.g. Base64Reader)
+    - return: (width, height), or None if the format is not recognized
+    """
+    header = reader.read(0, 32)
+    # PNG: IHDR is always the first chunk
+    if header.startswith(b'\x89PNG\r\n\x1a\n') and header[12:16] == b'IHDR':
+        return struct.unpack('>II', header[16:24])
+    # GIF: logical screen size
+    if header[:6] in (b'GIF87a', b'GIF89a'):
+        return struct.unpack('<HH', header[6:10])
+    # JPEG: walk segments until the frame header
+    if header.startswith(b'\xff\xd8'):
+        return _probe_jpeg(reader)
+    # SVG: size attributes of the root element
+    if header.lstrip().startswith((b'<?xml', b'<svg', b'<!--', b'<!DOCTYPE')):
+        return _probe_svg(reader.read(0, 4096))
+    return None
+
+def _probe_jpeg(reader):
+    """
+    Get JPEG image size from its frame header
+    - reader: object with a read(start, length) method
+    - return: (width, height), or None if there is no frame header
+    """
+    offset = 2
+    while True:
+        segment = reader.read(offset, 9)
+        if len(segment) < 4 or segment[0] != 0xFF:
+            return None
+        marker = segment[1]
+        # padding and markers without length
+        if marker == 0xFF:
+            offset += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            offset += 2
+            continue
+        if marker in JPEG_SOF:
+            if len(segment) < 9:
+                return None
+            height, width = struct.unpack('>HH', segment[5:9])
+            return (width, height)
+        # start of scan or end of image before any frame header
+        if marker in (0xDA, 0xD9):
+            return None
+        offset += 2 + struct.unpack('>H', segment[2:4])[0]
+
+def _probe_svg(header):
     """
-    Get image size from file
-    file: file element
-    return { "width": int, "height": int }
+    Get SVG image size from the attributes of its root element
+    - header: first bytes of the file
+    - return: (width, height), or None if the size is relative or missing
     """
-    if not file:
+    tag = SVG_TAG.search(header)
+    if not tag:
         return None
-    with Image.open(io.BytesIO(base64.decodebytes(bytes(file.text, "utf-8")))) as img:
-        size = img.size
-        return {
-            "width": size[0],
-            "height": size[1]
-        }
\ No newline at end of file
+    attributes = { name.lower(): value for name, value in SVG_ATTRIBUTE.findall(tag.group(0)) }
+    width = SVG_LENGTH.match(attributes.get(b'width', b''))
+    height = SVG_LENGTH.match(attributes.get(b'height', b''))
+    if width and height:
+        return (round(float(width.group(1))), round(float(height.group(1))))
+    viewbox = attributes.get(b'viewbox', b'').replace(b',', b' ').split()
+    if len(viewbox) == 4:
+        try:
+            return (round(float(viewbox[2])), round(float(viewbox[3])))
+        except ValueError:
+            return None
+    return None
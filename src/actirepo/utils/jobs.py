@@ -0,0 +1,49 @@
+"""
+Worker pool utilities
+- set_jobs: set the number of parallel workers
+- get_jobs: get the number of parallel workers
+- parallel_map: apply a function to every item, in parallel if there are several workers
+"""
+
+import threading
+
+_jobs = 1
+
+# set in the workers of parallel_map, so nested calls run serially in them
+_worker = threading.local()
+
+def set_jobs(jobs):
+    """
+    Set the number of parallel workers
+    - jobs: number of workers (1 means serial execution)
+    """
+    global _jobs
+    _jobs = max(1, int(jobs))
+
+def get_jobs():
+    """
+    Get the number of parallel workers
+    """
+    return _jobs
+
+def parallel_map(function, items):
+    """
+    Apply a function to every item, in parallel if there are several workers.
+    Only the outermost call is parallel: calls made inside a worker (e.g. the questions of the activities of
+    a category) run serially in it, so there are never more than jobs threads.
+    - function: function to apply
+    - items: iterable of items
+    - return: list of results, in the same order as items
+    """
+    items = list(items)
+    if _jobs == 1 or len(items) < 2 or getattr(_worker, 'active', False):
+        return [ function(item) for item in items ]
+    # imported here, serial runs do not need it
+    from concurrent.futures import ThreadPoolExecutor
+
+    def work(item):
+        _worker.active = True
+        return function(item)
+
+    with ThreadPoolExecutor(max_workers=min(_jobs, len(items))) as executor:
+        return list(executor.map(work, items))
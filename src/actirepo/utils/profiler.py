@@ -0,0 +1,103 @@
+"""
+Lightweight profiler: timed spans of the phases of a run (disabled unless enabled)
+- enable: start recording spans
+- is_enabled: check if spans are being recorded
+- span: context manager that records a timed span
+- summary: get the time spent in each phase
+- print_summary: print the time spent in each phase as a table
+- export_trace: write the spans in Chrome trace format (chrome://tracing, Perfetto, speedscope)
+"""
+
+import os
+import json
+import time
+import threading
+
+from contextlib import contextmanager
+
+_enabled = False
+_origin = None
+_spans = []
+_lock = threading.Lock()
+
+def enable():
+    """
+    Start recording spans (from now on)
+    """
+    global _enabled, _origin
+    _origin = time.perf_counter()
+    _enabled = True
+
+def is_enabled():
+    """
+    Check if spans are being recorded
+    """
+    return _enabled
+
+@contextmanager
+def span(name, **args):
+    """
+    Record a timed span (nothing is recorded if the profiler is not enabled)
+    - name: phase name (spans with the same name are added up in the summary)
+    - args: details of the span, e.g. the artifact or question (shown in the trace)
+    """
+    if not _enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        with _lock:
+            _spans.append((name, start, end, threading.get_ident(), args))
+
+def summary():
+    """
+    Get the time spent in each phase (nested spans are also counted in their parents)
+    - returns: list of (name, count, total seconds, mean seconds, max seconds), by total time
+    """
+    phases = {}
+    with _lock:
+        spans = list(_spans)
+    for name, start, end, _, _ in spans:
+        count, total, longest = phases.get(name, (0, 0, 0))
+        phases[name] = (count + 1, total + end - start, max(longest, end - start))
+    rows = [ (name, count, total, total / count, longest) for name, (count, total, longest) in phases.items() ]
+    return sorted(rows, key=lambda row: row[2], reverse=True)
+
+def print_summary():
+    """
+    Print the time spent in each phase as a table
+    """
+    from tabulate import tabulate
+    wall = time.perf_counter() - _origin if _origin else 0
+    rows = [ (name, count, f'{total:.3f}', f'{mean * 1000:.2f}', f'{longest * 1000:.2f}', f'{total / wall * 100:.1f}' if wall else '-')
+             for name, count, total, mean, longest in summary() ]
+    print(tabulate(rows, headers=[ 'phase', 'count', 'total (s)', 'mean (ms)', 'max (ms)', '% wall' ]))
+
+def export_trace(file):
+    """
+    Write the spans in Chrome trace format
+    - file: path to json file
+    """
+    with _lock:
+        spans = list(_spans)
+    pid = os.getpid()
+    threads = {}
+    events = []
+    for name, start, end, thread, args in spans:
+        tid = threads.setdefault(thread, len(threads) + 1)
+        events.append({
+            'name': name,
+            'cat': name.split('.')[0],
+            'ph': 'X',
+            'ts': round((start - _origin) * 1e6, 3),
+            'dur': round((end - start) * 1e6, 3),
+            'pid': pid,
+            'tid': tid,
+            'args': { key: str(value) for key, value in args.items() }
+        })
+    events += [ { 'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': { 'name': f'worker {tid}' if tid > 1 else 'main' } } for tid in threads.values() ]
+    with open(file, 'w', encoding='utf-8') as outfile:
+        json.dump({ 'traceEvents': events, 'displayTimeUnit': 'ms' }, outfile)
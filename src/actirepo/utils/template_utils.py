@@ -0,0 +1,47 @@
+"""
+Jinja environments shared by the whole process
+- get_environment: Get the environment of a templates directory (templates are compiled once, and cached across runs)
+"""
+
+import os
+import threading
+
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
+
+from actirepo.utils.file_utils import user_cache_dir
+
+# directory of the compiled templates cache
+BYTECODE_CACHE_DIR = user_cache_dir('jinja')
+
+# environments created in this process, by (templates directory, filter names)
+_environments = {}
+_lock = threading.Lock()
+
+def _bytecode_cache():
+    """
+    Get the compiled templates cache (None if its directory cannot be created)
+    - return: FileSystemBytecodeCache or None
+    """
+    try:
+        os.makedirs(BYTECODE_CACHE_DIR, exist_ok=True)
+    except OSError:
+        return None
+    return FileSystemBytecodeCache(BYTECODE_CACHE_DIR)
+
+def get_environment(path, filters = None):
+    """
+    Get the environment of a templates directory, created (and its filters registered) only once per process
+    - path: templates directory
+    - filters: dictionary { name: function } of filters used by the templates
+    - return: jinja2 Environment
+    """
+    filters = filters or {}
+    key = (path, tuple(sorted(filters)))
+    with _lock:
+        env = _environments.get(key)
+        if env is None:
+            # templates are part of the package, they do not change while running
+            env = Environment(loader = FileSystemLoader(path, encoding='utf8'), bytecode_cache = _bytecode_cache(), auto_reload = False)
+            env.filters.update(filters)
+            _environments[key] = env
+        return env
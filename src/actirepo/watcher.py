@@ -0,0 +1,300 @@
+"""
+Watch a tree of artifacts and report changes in their sources (descriptors and quiz files)
+- InotifyWatcher: watcher based on Linux inotify (through ctypes)
+- PollingWatcher: watcher that compares snapshots of the tree (works everywhere)
+- create_watcher: create the best watcher available
+- is_source: check if a path is a source of some artifact
+- affected_artifacts: get the artifacts to rebuild after some sources changed
+- watch: wait for changes, debounce them and pass them to a callback, forever
+"""
+
+import os
+import sys
+import time
+import errno
+import struct
+import select
+import ctypes
+import ctypes.util
+
+from .scanner import scan
+
+# artifact descriptors
+DESCRIPTORS = { 'activity.json', 'category.json', 'repo.json' }
+
+# directories that only hold generated files
+IGNORED_DIRS = { 'images' }
+
+# seconds without changes before a burst of changes is reported
+DEBOUNCE = 0.5
+
+# seconds between snapshots of the polling watcher
+POLL_INTERVAL = 1.0
+
+def is_source(path):
+    """
+    Check if a path is a source of some artifact (a descriptor or a quiz file; generated directories are never watched)
+    - path: path to file
+    - returns: True if changes in path may change some README, False otherwise
+    """
+    name = os.path.basename(path)
+    return name in DESCRIPTORS or name.endswith('.xml')
+
+def _is_watched_dir(name):
+    """
+    Check if a directory (by name) may hold sources
+    """
+    return name not in IGNORED_DIRS and not name.startswith('.')
+
+class InotifyWatcher:
+    """
+    Watcher based on Linux inotify: every directory of the tree is watched, and new directories are added as they appear
+    """
+
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+
+    # events that may change a source (attributes, because the builds compare mtimes)
+    MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+
+    # struct inotify_event header: wd, mask, cookie, len
+    EVENT = struct.Struct('iIII')
+
+    def __init__(self, root):
+        self.root = os.path.normpath(root)
+        self.libc = InotifyWatcher.__libc()
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, os.strerror(code))
+        self.dirs = {}
+        self.__add_tree(self.root)
+
+    @staticmethod
+    def __libc():
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        # raises AttributeError if there is no inotify
+        libc.inotify_init1.argtypes = [ ctypes.c_int ]
+        libc.inotify_add_watch.argtypes = [ ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32 ]
+        return libc
+
+    @staticmethod
+    def available():
+        """
+        Check if inotify is available in this system
+        """
+        if not sys.platform.startswith('linux'):
+            return False
+        try:
+            InotifyWatcher.__libc()
+            return True
+        except (OSError, AttributeError):
+            return False
+
+    def __add_tree(self, path):
+        """
+        Watch a directory and its subdirectories
+        - path: path to directory
+        - returns: source files found in the tree (they may have been created before the watch)
+        """
+        sources = []
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), InotifyWatcher.MASK)
+        if wd < 0:
+            code = ctypes.get_errno()
+            if code == errno.ENOSPC:
+                raise OSError(code, 'inotify watch limit reached (see /proc/sys/fs/inotify/max_user_watches)')
+            return sources
+        self.dirs[wd] = path
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if _is_watched_dir(entry.name):
+                            sources.extend(self.__add_tree(entry.path))
+                    elif is_source(entry.path):
+                        sources.append(entry.path)
+        except OSError:
+            pass
+        return sources
+
+    def wait(self, timeout = None):
+        """
+        Wait for changes
+        - timeout: max seconds to wait (None to wait forever)
+        - returns: set of changed sources (empty if the timeout expired), or None if events were lost
+        """
+        ready, _, _ = select.select([ self.fd ], [], [], timeout)
+        if not ready:
+            return set()
+        data = os.read(self.fd, 64 * 1024)
+        changes = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = InotifyWatcher.EVENT.unpack_from(data, offset)
+            name = data[offset + InotifyWatcher.EVENT.size:offset + InotifyWatcher.EVENT.size + length].rstrip(b'\0')
+            offset += InotifyWatcher.EVENT.size + length
+            if mask & InotifyWatcher.IN_Q_OVERFLOW:
+                return None
+            if mask & InotifyWatcher.IN_IGNORED:
+                self.dirs.pop(wd, None)
+                continue
+            directory = self.dirs.get(wd)
+            if directory is None:
+                continue
+            path = os.path.join(directory, os.fsdecode(name)) if name else directory
+            if mask & InotifyWatcher.IN_ISDIR:
+                # a directory (and maybe artifacts in it) appeared or disappeared
+                if mask & (InotifyWatcher.IN_CREATE | InotifyWatcher.IN_MOVED_TO) and _is_watched_dir(os.path.basename(path)):
+                    changes.update(self.__add_tree(path))
+                if mask & (InotifyWatcher.IN_DELETE | InotifyWatcher.IN_MOVED_FROM):
+                    changes.add(os.path.join(path, ''))
+            elif mask & InotifyWatcher.IN_DELETE_SELF:
+                continue
+            elif is_source(path) and not mask & InotifyWatcher.IN_CREATE:
+                # created files are reported when they are closed
+                changes.add(path)
+        return changes
+
+    def close(self):
+        os.close(self.fd)
+
+class PollingWatcher:
+    """
+    Watcher that compares snapshots of the sources of the tree (size and mtime)
+    """
+
+    def __init__(self, root, interval = POLL_INTERVAL):
+        self.root = os.path.normpath(root)
+        self.interval = interval
+        self.snapshot = self.__snapshot()
+
+    def __snapshot(self):
+        """
+        Get size and mtime of every source in the tree
+        - returns: dictionary { path: (size, mtime) }
+        """
+        snapshot = {}
+        for path, dirs, files in os.walk(self.root):
+            dirs[:] = [ dir for dir in dirs if _is_watched_dir(dir) ]
+            for file in files:
+                file = os.path.join(path, file)
+                if is_source(file):
+                    try:
+                        stat = os.stat(file)
+                    except OSError:
+                        continue
+                    snapshot[file] = (stat.st_size, stat.st_mtime_ns)
+        return snapshot
+
+    def wait(self, timeout = None):
+        """
+        Wait for changes
+        - timeout: max seconds to wait (None to wait forever)
+        - returns: set of changed sources (empty if the timeout expired)
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            delay = self.interval if deadline is None else min(self.interval, max(0, deadline - time.monotonic()))
+            time.sleep(delay)
+            snapshot = self.__snapshot()
+            changes = { path for path in snapshot.keys() | self.snapshot.keys() if snapshot.get(path) != self.snapshot.get(path) }
+            self.snapshot = snapshot
+            if changes or (deadline is not None and time.monotonic() >= deadline):
+                return changes
+
+    def close(self):
+        pass
+
+def create_watcher(root, polling = False):
+    """
+    Create the best watcher available
+    - root: path to the tree to watch
+    - polling: if true, always use the polling watcher
+    - returns: watcher
+    """
+    if not polling and InotifyWatcher.available():
+        try:
+            return InotifyWatcher(root)
+        except OSError as e:
+            print(f'inotify not available ({e}), polling every {POLL_INTERVAL} s')
+    return PollingWatcher(root)
+
+def _parent(path):
+    """
+    Get the parent of a normalized path (also a normalized path, '.' for relative paths with one part)
+    """
+    return os.path.normpath(os.path.dirname(path))
+
+def affected_artifacts(root, changes):
+    """
+    Get the artifacts to rebuild after some sources changed: the activities whose sources changed
+    and the categories above them (or above the changed categories), up to the root
+    - root: path to the watched artifact
+    - changes: changed sources
+    - returns: list of (kind, path), kind is 'activity' or 'category', children before their parents
+    """
+    root = os.path.normpath(root)
+    activities = set()
+    categories = set()
+    for change in changes:
+        directory = os.path.normpath(os.path.dirname(change))
+        # changes outside the root do not matter
+        if os.path.relpath(directory, root).startswith(os.pardir):
+            continue
+        # climb to the closest directory that still exists (the changed one may have been removed)
+        while not os.path.isdir(directory) and directory != root:
+            directory = _parent(directory)
+        node = scan(directory, recursive=False)
+        if node.is_activity and not node.is_category:
+            activities.add(directory)
+            if directory == root:
+                continue
+            directory = _parent(directory)
+        elif not node.is_category and directory != root:
+            # no longer an artifact (e.g. its quizzes were removed), its category lists it
+            directory = _parent(directory)
+        # every category from here up to the root lists the changed artifact (or its totals)
+        while True:
+            categories.add(directory)
+            if directory == root:
+                break
+            directory = _parent(directory)
+    # deepest first, so categories are rebuilt after their children
+    depth = lambda path: len(os.path.relpath(path, root).split(os.sep)) if path != root else 0
+    result = [ ('activity', path) for path in sorted(activities, key=depth, reverse=True) ]
+    result += [ ('category', path) for path in sorted(categories, key=depth, reverse=True) ]
+    return result
+
+def watch(root, callback, polling = False, debounce = DEBOUNCE):
+    """
+    Wait for changes in the sources of a tree and pass them to a callback, until interrupted
+    - root: path to the tree to watch
+    - callback: function called with the set of changed sources (None if some changes were lost)
+    - polling: if true, always use the polling watcher
+    - debounce: seconds without changes before a burst of changes is reported
+    """
+    watcher = create_watcher(root, polling)
+    try:
+        while True:
+            changes = watcher.wait()
+            # wait until the burst of changes ends (e.g. an editor saving many files)
+            while changes:
+                more = watcher.wait(debounce)
+                if more is None:
+                    changes = None
+                elif not more:
+                    break
+                else:
+                    changes |= more
+            if changes is None or changes:
+                callback(changes)
+    finally:
+        watcher.close()
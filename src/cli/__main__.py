@@ -1,9 +1,12 @@
+import os
 import time
 import argparse
 
-from actirepo.activity import Activity
-from actirepo.category import Category
-from actirepo.repo import Repo
+from actirepo.render.cache import RenderCache
+from actirepo.render.encoder import ImageEncoder
+from actirepo.render.assets import ASSET_MODES, DEFAULT_ASSET_MODE
+from actirepo.render.session import session, RENDERERS, DEFAULT_RENDERER
+from actirepo.utils.jobs import set_jobs
 
 from actirepo.__init__ import __module__, __project_name__, __project_version__, __project_description__
 
@@ -33,7 +36,25 @@ def main():
     options.add_argument('--create', action='store_true', help='Crea los metadatos del artefacto especificado (actitidad, categoría o repositorio)')
     options.add_argument('--readme', action='store_true', help='Crea el archivo README.md')
     options.add_argument('-r', '--recursive', action='store_true', help='Se aplica el comando de forma recursiva. Se puede combinar con --readme')
-    options.add_argument('-f', '--force', action='store_true', help='Forzar la creación de README.md aunque no sea necesario. Se puede combinar con --readme')
+    options.add_argument('-f', '--force', action='store_true', help='Forzar la creación de README.md (y de las imágenes de sus preguntas) aunque no sea necesario. Se puede combinar con --readme')
+    options.add_argument('--renderer', choices=RENDERERS.keys(), default=DEFAULT_RENDERER, help=f'Motor para renderizar las preguntas (por defecto {DEFAULT_RENDERER}): ' + ', '.join(f'{name} ({renderer["description"]})' for name, renderer in RENDERERS.items()))
+    options.add_argument('--pages', metavar='N', type=int, default=1, help='Número de pestañas del navegador que se mantienen abiertas para renderizar las preguntas (por defecto 1)')
+    options.add_argument('--batch', metavar='N', type=int, default=1, help='Número de preguntas de un mismo fichero que se cargan juntas en una página para capturarlas (por defecto 1, cada pregunta en su propia página)')
+    options.add_argument('--assets', choices=ASSET_MODES.keys(), default=DEFAULT_ASSET_MODE, help=f'Cómo se pasan al navegador las imágenes incrustadas en las preguntas (por defecto {DEFAULT_ASSET_MODE}): ' + ', '.join(f'{name} ({description})' for name, description in ASSET_MODES.items()))
+    options.add_argument('--no-cache', action='store_true', help='No utiliza la caché de imágenes: se renderizan todas las preguntas')
+    options.add_argument('--clear-cache', action='store_true', help='Vacía la caché de imágenes antes de empezar')
+    options.add_argument('--cache-dir', metavar='RUTA', default=RenderCache.DEFAULT_DIR, help=f'Directorio de la caché de imágenes (por defecto {RenderCache.DEFAULT_DIR})')
+    options.add_argument('--cache-size', metavar='MB', type=int, default=RenderCache.DEFAULT_SIZE, help=f'Tamaño máximo de la caché de imágenes en MB (por defecto {RenderCache.DEFAULT_SIZE})')
+    options.add_argument('--image-format', choices=ImageEncoder.FORMATS.keys(), default=ImageEncoder.DEFAULT_FORMAT, help=f'Formato de las imágenes de las preguntas (por defecto {ImageEncoder.DEFAULT_FORMAT})')
+    options.add_argument('--compression', metavar='N', type=int, choices=range(10), default=ImageEncoder.DEFAULT_COMPRESSION, help=f'Nivel de compresión de las imágenes PNG, de 0 a 9 (por defecto {ImageEncoder.DEFAULT_COMPRESSION})')
+    options.add_argument('--optimize', action='store_true', help='Busca la codificación más pequeña de las imágenes PNG (más lento)')
+    options.add_argument('--colors', metavar='N', type=int, default=0, help='Reduce las imágenes a una paleta de N colores (por defecto no se reducen)')
+    options.add_argument('--quality', metavar='Q', type=int, help='Calidad de las imágenes WebP, de 0 a 100 (por defecto, sin pérdida)')
+    options.add_argument('--encoders', metavar='N', type=int, default=1, help='Número de tareas que recortan y codifican las imágenes mientras se renderizan las siguientes (0 para hacerlo en la misma tarea; por defecto 1)')
+    options.add_argument('-w', '--watch', action='store_true', help='Tras generar los README, vigila los descriptores y ficheros de preguntas y regenera los artefactos afectados por cada cambio (Ctrl+C para terminar). Sólo se puede usar junto con --readme')
+    options.add_argument('--poll', action='store_true', help='Con --watch, detecta los cambios revisando los ficheros periódicamente en lugar de usar inotify')
+    options.add_argument('--profile', metavar='FICHERO', nargs='?', const='actirepo-profile.json', help='Mide el tiempo de cada fase (lectura de los cuestionarios, enlaces a los ficheros incrustados, plantillas, capturas, recorte de imágenes, medidas) por artefacto y pregunta, muestra un resumen y guarda la traza en formato Chrome (chrome://tracing, Perfetto) en FICHERO (por defecto actirepo-profile.json)')
+    options.add_argument('-j', '--jobs', metavar='N', type=int, default=1, help='Número de tareas en paralelo para renderizar preguntas y generar los README de las actividades (por defecto 1)')
 
     # parsea los argumentos
     args = parser.parse_args()
@@ -45,29 +66,115 @@ def main():
         parser.print_help()
         return
 
-    elif args.activity:
-        if args.create:
-            Activity.create(args.activity)
-        elif args.readme:
-            activity = Activity(args.activity)
-            activity.create_readme(args.force)
-
-    elif args.category:
-        if args.create:
-            Category.create(args.category)
-        elif args.readme:
-            category = Category(args.category)
-            category.create_readme(args.recursive)
-
-    elif args.repository:
-        if args.create:
-            Repo.create(args.repository)
-        elif args.readme:
-            repo = Repo(args.repository)
-            repo.create_readme(args.recursive)
+    # sólo se vigilan los cambios para regenerar los README
+    if args.watch and not args.readme:
+        parser.error('--watch sólo se puede usar junto con --readme')
+    if args.poll and not args.watch:
+        parser.error('--poll sólo se puede usar junto con --watch')
+
+    # los artefactos (y sus dependencias) sólo se importan si hay que procesarlos, para que --help y --version sean inmediatos
+    from actirepo.activity import Activity
+    from actirepo.category import Category
+    from actirepo.repo import Repo
+    from actirepo.moodle.stats_cache import stats_cache
+
+    # registra el tiempo de cada fase desde aquí
+    if args.profile:
+        from actirepo.utils import profiler
+        profiler.enable()
+
+    # reparte el trabajo entre varias tareas (cada una necesita su pestaña del navegador)
+    set_jobs(args.jobs)
+
+    # las preguntas cuyo HTML ya se renderizó se copian desde la caché
+    cache = RenderCache(args.cache_dir, args.cache_size)
+    if args.clear_cache:
+        cache.clear()
+
+    # las capturas se recortan y codifican una sola vez, en memoria
+    encoder = ImageEncoder(args.image_format, args.compression, args.optimize, args.colors, args.quality, args.encoders)
+
+    # con --no-cache se renderizan de nuevo todas las preguntas, aunque no hayan cambiado
+    # la misma sesión del navegador se reutiliza en todos los renderizados, y las estadísticas
+    # de los cuestionarios que no han cambiado se leen de la caché del repositorio (.actirepo)
+    with session(pages=max(args.pages, args.jobs), cache=None if args.no_cache else cache, renderer=args.renderer, encoder=encoder, batch=args.batch, assets=args.assets, refresh=args.no_cache), \
+         stats_cache(args.activity or args.category or args.repository):
+        if args.activity:
+            if args.create:
+                Activity.create(args.activity)
+            elif args.readme:
+                activity = Activity(args.activity)
+                activity.create_readme(args.force)
+
+        elif args.category:
+            if args.create:
+                Category.create(args.category)
+            elif args.readme:
+                category = Category(args.category)
+                category.create_readme(args.recursive, args.force)
+
+        elif args.repository:
+            if args.create:
+                Repo.create(args.repository)
+            elif args.readme:
+                repo = Repo(args.repository)
+                repo.create_readme(args.recursive, args.force)
+
+        # mantiene el proceso abierto (con los cuestionarios, plantillas y navegador ya cargados) y
+        # regenera sólo los artefactos afectados por cada cambio
+        if args.watch:
+            watch_readmes(args, Activity, Category, Repo)
+
+    if args.profile:
+        profiler.print_summary()
+        profiler.export_trace(args.profile)
+        print(f'Traza guardada en {args.profile}')
 
     print(f"Elapsed time: {time.time() - start_time:.2f} s")
 
+def watch_readmes(args, Activity, Category, Repo):
+    """
+    Vigila los ficheros fuente del artefacto indicado en los argumentos y regenera los README afectados por cada cambio
+    - args: argumentos de la línea de comandos
+    - Activity, Category, Repo: clases de los artefactos (se importan en main)
+    """
+    from actirepo.watcher import watch, affected_artifacts
+    from actirepo.moodle.stats_cache import get_cache
+
+    root = os.path.normpath(args.activity or args.category or args.repository)
+    Root = Activity if args.activity else Category if args.category else Repo
+
+    def rebuild(changes):
+        start_time = time.time()
+        if changes is None:
+            # se han perdido eventos: se revisa todo (sólo se regenera lo que esté desactualizado)
+            print('Se han perdido cambios, revisando todos los artefactos...')
+            artifacts = [ ('activity' if args.activity else 'category', root) ]
+        else:
+            artifacts = affected_artifacts(root, changes)
+        for kind, path in artifacts:
+            if path == root:
+                if args.activity:
+                    Root(path).create_readme()
+                else:
+                    Root(path).create_readme(args.recursive and changes is None)
+            elif kind == 'activity':
+                # sin --recursive sólo se regeneran las categorías
+                if args.recursive:
+                    Activity(path).create_readme()
+            else:
+                Category(path).create_readme()
+        cache = get_cache()
+        if cache:
+            cache.save()
+        print(f"Elapsed time: {time.time() - start_time:.2f} s")
+
+    print(f'Vigilando los cambios en {root} (Ctrl+C para terminar)...')
+    try:
+        watch(root, rebuild, polling=args.poll)
+    except KeyboardInterrupt:
+        print()
+
 if __name__ == "__main__":
     main()
 